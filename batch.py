@@ -0,0 +1,152 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from headless import Simulation
+
+
+def random_commands(_seed, _frames=900, _min_frames=10, _max_frames=60):
+    """Generate a random but repeatable sequence of driving commands for Simulation.run.
+
+    The robot mostly drives forward, sometimes while turning, and sometimes stops to turn on the
+    spot.
+    """
+    _rng = np.random.default_rng(_seed)
+    _options = [("UP",), ("UP",), ("UP", "LEFT"), ("UP", "RIGHT"), ("LEFT",), ("RIGHT",), ()]
+    _commands = []
+    _total = 0
+    while _total < _frames:
+        _count = int(min(_rng.integers(_min_frames, _max_frames + 1), _frames - _total))
+        _commands.append((_options[_rng.integers(len(_options))], _count))
+        _total += _count
+    return _commands
+
+
+def map_accuracy(_map, _world_grid, _map_cell_size, _world_cell_size):
+    """Compare a SLAM occupancy map with the ground truth world grid.
+
+    Each map cell is compared with the world cell under its centre. Cells whose probability is
+    still 0.5 have never been observed and are only counted towards the coverage.
+
+    Returns:
+        A tuple of (accuracy, coverage), the fraction of observed cells that were correctly
+        classified as occupied or free, and the fraction of cells that were observed.
+    """
+    _rows = ((np.arange(_map.shape[0]) + 0.5) * _map_cell_size // _world_cell_size).astype(int)
+    _cols = ((np.arange(_map.shape[1]) + 0.5) * _map_cell_size // _world_cell_size).astype(int)
+    _rows = np.minimum(_rows, _world_grid.shape[0] - 1)
+    _cols = np.minimum(_cols, _world_grid.shape[1] - 1)
+    _truth = _world_grid[np.ix_(_rows, _cols)] != 0
+    _observed = _map != 0.5
+    if not _observed.any():
+        return 0.0, 0.0
+    _correct = (_map > 0.5) == _truth
+    return float(_correct[_observed].mean()), float(_observed.mean())
+
+
+def run_trial(_config):
+    """Run one headless simulation and measure its map quality and pose error.
+
+    This is a module level function so that it can be sent to worker processes.
+
+    Attributes:
+        _config: A dictionary with a "seed" and optionally an "odo_error", "world_type",
+            "slam_type", "map_path", "record_path", "frames" and "commands". If no commands are
+            given they are generated from the seed.
+    """
+    _seed = _config["seed"]
+    _commands = _config.get("commands") or random_commands(_seed, _config.get("frames", 900))
+    _simulation = Simulation(_world_type=_config.get("world_type", "Occupancy Grid"),
+                             _seed=_seed,
+                             _slam_type=_config.get("slam_type", "Occupancy Grid"),
+                             _map_path=_config.get("map_path"),
+                             _record_path=_config.get("record_path"))
+    if "odo_error" in _config:
+        _simulation.slam.odo_error = _config["odo_error"]
+    _results = _simulation.run(_commands)
+
+    _error = np.linalg.norm(_results["truth_pos"] - _results["estimate_pos"], axis=1)
+    _odo_error = np.linalg.norm(_results["truth_pos"] - _results["odo_pos"], axis=1)
+    _accuracy, _coverage = map_accuracy(_results["map"],
+                                        _results["world"],
+                                        _simulation.slam.grid_size,
+                                        _simulation.world.size)
+    _stats = dict(_config)
+    _stats.pop("commands", None)
+    _stats.update({"frames": len(_error),
+                   "odo_rmse": float(np.sqrt(np.mean(np.square(_odo_error)))) if len(_error) else 0.0,
+                   "pose_rmse": float(np.sqrt(np.mean(np.square(_error)))) if len(_error) else 0.0,
+                   "final_pose_error": float(_error[-1]) if len(_error) else 0.0,
+                   "map_accuracy": _accuracy,
+                   "map_coverage": _coverage})
+    return _stats
+
+
+def run_batch(_configs, _workers=None):
+    """Run many independent simulations across a pool of worker processes.
+
+    Each run is deterministic for its seed, so the results don't depend on the number of workers
+    or the order runs finish in. Runs are handed to the workers in chunks to keep the overhead of
+    sending them small when there are many short runs.
+
+    Attributes:
+        _configs: A list of run configurations, as taken by run_trial.
+        _workers: The number of worker processes, which defaults to the number of CPUs.
+
+    Returns:
+        A list of the statistics of each run, in the same order as _configs.
+    """
+    _workers = _workers or os.cpu_count() or 1
+    _chunk_size = max(1, len(_configs) // (_workers * 4))
+    if _workers == 1:
+        return [run_trial(_config) for _config in _configs]
+    with ProcessPoolExecutor(max_workers=_workers) as _executor:
+        return list(_executor.map(run_trial, _configs, chunksize=_chunk_size))
+
+
+def summarise(_results, _metrics=("odo_rmse", "pose_rmse", "final_pose_error", "map_accuracy",
+                                  "map_coverage")):
+    """Return the mean, standard deviation, minimum and maximum of each metric over all runs."""
+    _summary = {}
+    for _metric in _metrics:
+        _values = np.array([_result[_metric] for _result in _results], dtype=np.float64)
+        _summary[_metric] = {"mean": float(_values.mean()),
+                             "std": float(_values.std()),
+                             "min": float(_values.min()),
+                             "max": float(_values.max())}
+    return _summary
+
+
+if __name__ == '__main__':
+    _parser = argparse.ArgumentParser(description="Run many headless simulations in parallel.")
+    _parser.add_argument("--runs", type=int, default=16)
+    _parser.add_argument("--workers", type=int, default=None)
+    _parser.add_argument("--seed", type=int, default=0, help="Seed of the first run.")
+    _parser.add_argument("--frames", type=int, default=900)
+    _parser.add_argument("--odo-error", type=float, nargs="+", default=[0.2],
+                         help="Odometry errors to cycle through across runs.")
+    _parser.add_argument("--world-type", default="Occupancy Grid",
+                         choices=["Occupancy Grid", "Landmarks"])
+    _parser.add_argument("--slam-type", default="Occupancy Grid",
+                         choices=["Occupancy Grid", "Particle Filter", "Scan Matcher"])
+    _parser.add_argument("--map", default=None,
+                         help="Grid file, or ROS map YAML file, to load the world map from.")
+    _parser.add_argument("--record-dir", default=None,
+                         help="Directory to record a log file of every run's scans and poses to.")
+    _args = _parser.parse_args()
+
+    _configs = [{"seed": _args.seed + _i,
+                 "odo_error": _args.odo_error[_i % len(_args.odo_error)],
+                 "world_type": _args.world_type,
+                 "slam_type": _args.slam_type,
+                 "map_path": _args.map,
+                 "frames": _args.frames}
+                for _i in range(_args.runs)]
+    if _args.record_dir is not None:
+        os.makedirs(_args.record_dir, exist_ok=True)
+        for _config in _configs:
+            _config["record_path"] = os.path.join(_args.record_dir,
+                                                  "run_{}.log".format(_config["seed"]))
+    for _metric, _stats in summarise(run_batch(_configs, _args.workers)).items():
+        print("{:<18} mean {mean:10.4f}  std {std:10.4f}  min {min:10.4f}  max {max:10.4f}"
+              .format(_metric, **_stats))
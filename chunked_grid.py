@@ -0,0 +1,182 @@
+import numpy as np
+
+
+class ChunkedGrid():
+    """A sparse 2D grid stored as square chunks of cells, allocated when first written to.
+
+    Cells that have never been written to hold a fill value and take no memory, so a large map
+    only costs memory for the parts of it that have been explored. The grid can be read and
+    written like a NumPy array with a pair of slices, for a rectangular window of cells, or a pair
+    of arrays of rows and columns, for individual cells. Slices are clipped to the grid's shape
+    like a NumPy array's, whereas arrays address cells directly and may reach outside of it, so
+    the grid can grow in any direction. Cells written outside of the shape are only found by
+    ChunkedGrid.bounds and by arrays of rows and columns, not by slicing or converting the grid.
+
+    Attributes:
+        _shape: The (rows, columns) extent of the grid, used when slicing or converting it to an
+            array.
+        _fill: The value of cells that have never been written to.
+        _chunk_size: The width of each square chunk in cells.
+        _dtype: The NumPy data type of the cells.
+    """
+
+    def __init__(self, _shape, _fill=0.0, _chunk_size=64, _dtype=np.float32):
+        self.shape = tuple(_shape)
+        self.chunk_size = _chunk_size
+        self.dtype = np.dtype(_dtype)
+        self.fill = self.dtype.type(_fill)
+        self.chunks = {}  # (chunk row, chunk column) to the array of that chunk's cells
+
+    def __array__(self, dtype=None, copy=None):
+        _array = self.window(0, 0, self.shape[0], self.shape[1])
+        return _array if dtype is None else _array.astype(dtype)
+
+    def __getitem__(self, _key):
+        _rows, _cols = _key
+        if isinstance(_rows, slice):
+            return self.window(*self.slice_bounds(_rows, _cols))
+        return self.gather(_rows, _cols)
+
+    def __setitem__(self, _key, _values):
+        _rows, _cols = _key
+        if isinstance(_rows, slice):
+            self.write_window(*self.slice_bounds(_rows, _cols), _values)
+        else:
+            self.scatter(_rows, _cols, _values)
+
+    @property
+    def nbytes(self):
+        """The memory used by the allocated chunks in bytes."""
+        return len(self.chunks) * self.chunk_size * self.chunk_size * self.dtype.itemsize
+
+    def slice_bounds(self, _rows, _cols):
+        """Convert a pair of slices to the (top, left, bottom, right) of the window of cells they
+        select, clipped to the grid's shape."""
+        _top, _bottom, _row_step = _rows.indices(self.shape[0])
+        _left, _right, _col_step = _cols.indices(self.shape[1])
+        if _row_step != 1 or _col_step != 1:
+            raise ValueError("ChunkedGrid slices can't have a step")
+        return _top, _left, max(_bottom, _top), max(_right, _left)
+
+    def chunk(self, _chunk_row, _chunk_col):
+        """Return the cells of a chunk, allocating it if it hasn't been written to yet."""
+        _chunk = self.chunks.get((_chunk_row, _chunk_col))
+        if _chunk is None:
+            _chunk = np.full((self.chunk_size, self.chunk_size), self.fill, dtype=self.dtype)
+            self.chunks[_chunk_row, _chunk_col] = _chunk
+        return _chunk
+
+    def group(self, _rows, _cols):
+        """Group cells by the chunk they are in.
+
+        Returns:
+            A list of ((chunk row, chunk column), indices) pairs, where indices is an array of the
+            positions in _rows and _cols of the cells in that chunk.
+        """
+        _chunk_rows = _rows // self.chunk_size
+        _chunk_cols = _cols // self.chunk_size
+        # One integer per chunk, which is much faster to find the unique values of than pairs
+        _keys = (_chunk_rows << 32) + _chunk_cols
+        _unique, _first, _inverse = np.unique(_keys, return_index=True, return_inverse=True)
+        if len(_unique) == 1:
+            return [((int(_chunk_rows[0]), int(_chunk_cols[0])), np.arange(len(_keys)))]
+        _order = np.argsort(_inverse.reshape(-1), kind="stable")
+        _splits = np.cumsum(np.bincount(_inverse.reshape(-1), minlength=len(_unique)))[:-1]
+        return [((int(_chunk_rows[_index]), int(_chunk_cols[_index])), _indices)
+                for _index, _indices in zip(_first, np.split(_order, _splits))]
+
+    def gather(self, _rows, _cols):
+        """Return the values of the cells at arrays of rows and columns."""
+        _rows = np.asarray(_rows, dtype=np.int64)
+        _cols = np.asarray(_cols, dtype=np.int64)
+        _values = np.full(_rows.shape, self.fill, dtype=self.dtype)
+        if not _rows.size:
+            return _values
+        _flat_rows = _rows.reshape(-1)
+        _flat_cols = _cols.reshape(-1)
+        _flat_values = _values.reshape(-1)
+        for _key, _indices in self.group(_flat_rows, _flat_cols):
+            _chunk = self.chunks.get(_key)
+            if _chunk is not None:
+                _flat_values[_indices] = _chunk[_flat_rows[_indices] % self.chunk_size,
+                                                _flat_cols[_indices] % self.chunk_size]
+        return _values
+
+    def scatter(self, _rows, _cols, _values):
+        """Set the cells at arrays of rows and columns to an array of values, or a single value."""
+        _rows = np.asarray(_rows, dtype=np.int64).reshape(-1)
+        _cols = np.asarray(_cols, dtype=np.int64).reshape(-1)
+        _values = np.broadcast_to(np.asarray(_values, dtype=self.dtype), _rows.shape)
+        if not _rows.size:
+            return
+        for _key, _indices in self.group(_rows, _cols):
+            self.chunk(*_key)[_rows[_indices] % self.chunk_size,
+                              _cols[_indices] % self.chunk_size] = _values[_indices]
+
+    def add_at(self, _rows, _cols, _values):
+        """Add values to the cells at arrays of rows and columns, once for every time a cell
+        appears, like np.add.at."""
+        _rows = np.asarray(_rows, dtype=np.int64).reshape(-1)
+        _cols = np.asarray(_cols, dtype=np.int64).reshape(-1)
+        _values = np.broadcast_to(np.asarray(_values, dtype=self.dtype), _rows.shape)
+        if not _rows.size:
+            return
+        for _key, _indices in self.group(_rows, _cols):
+            np.add.at(self.chunk(*_key),
+                      (_rows[_indices] % self.chunk_size, _cols[_indices] % self.chunk_size),
+                      _values[_indices])
+
+    def chunk_range(self, _top, _left, _bottom, _right):
+        """Yield the (chunk row, chunk column) of every chunk overlapping a window of cells."""
+        for _chunk_row in range(_top // self.chunk_size, -(-_bottom // self.chunk_size)):
+            for _chunk_col in range(_left // self.chunk_size, -(-_right // self.chunk_size)):
+                yield _chunk_row, _chunk_col
+
+    def window(self, _top, _left, _bottom, _right):
+        """Return a copy of a rectangle of cells, from row _top and column _left up to but not
+        including row _bottom and column _right, as an array."""
+        _window = np.full((_bottom - _top, _right - _left), self.fill, dtype=self.dtype)
+        for _chunk_row, _chunk_col in self.chunk_range(_top, _left, _bottom, _right):
+            _chunk = self.chunks.get((_chunk_row, _chunk_col))
+            if _chunk is None:
+                continue
+            _row = _chunk_row * self.chunk_size
+            _col = _chunk_col * self.chunk_size
+            _from_row = max(_top, _row)
+            _from_col = max(_left, _col)
+            _to_row = min(_bottom, _row + self.chunk_size)
+            _to_col = min(_right, _col + self.chunk_size)
+            _window[_from_row - _top:_to_row - _top, _from_col - _left:_to_col - _left] = \
+                _chunk[_from_row - _row:_to_row - _row, _from_col - _col:_to_col - _col]
+        return _window
+
+    def write_window(self, _top, _left, _bottom, _right, _values):
+        """Write an array, or a single value, to a rectangle of cells.
+
+        Chunks that haven't been allocated yet are left unallocated if all of the values written
+        to them are the fill value.
+        """
+        _values = np.broadcast_to(np.asarray(_values, dtype=self.dtype),
+                                  (_bottom - _top, _right - _left))
+        for _chunk_row, _chunk_col in self.chunk_range(_top, _left, _bottom, _right):
+            _row = _chunk_row * self.chunk_size
+            _col = _chunk_col * self.chunk_size
+            _from_row = max(_top, _row)
+            _from_col = max(_left, _col)
+            _to_row = min(_bottom, _row + self.chunk_size)
+            _to_col = min(_right, _col + self.chunk_size)
+            _block = _values[_from_row - _top:_to_row - _top, _from_col - _left:_to_col - _left]
+            if (_chunk_row, _chunk_col) not in self.chunks and (_block == self.fill).all():
+                continue
+            self.chunk(_chunk_row, _chunk_col)[_from_row - _row:_to_row - _row,
+                                               _from_col - _col:_to_col - _col] = _block
+
+    def bounds(self):
+        """Return the (top, left, bottom, right) of the cells covered by allocated chunks, or
+        all zeros if no chunks have been allocated."""
+        if not self.chunks:
+            return 0, 0, 0, 0
+        _keys = np.array(list(self.chunks))
+        _top, _left = _keys.min(axis=0) * self.chunk_size
+        _bottom, _right = (_keys.max(axis=0) + 1) * self.chunk_size
+        return int(_top), int(_left), int(_bottom), int(_right)
@@ -127,7 +127,7 @@ class GUI():
         _slam_type_pos = (_setup_label_panel_pos[0],
                           _world_edit_pos[1] + _world_edit_size[1] + _vert_inner_padding)
         _slam_type_rect = pygame.Rect(_slam_type_pos, _slam_type_size)
-        _slam_list = ["Occupancy Grid", "Landmarks"]
+        _slam_list = ["Occupancy Grid", "Landmarks", "Particle Filter", "Scan Matcher"]
         self.slam_type_drop = pygui.elements.UIDropDownMenu(relative_rect=_slam_type_rect,
                                                             options_list=_slam_list,
                                                             starting_option="Occupancy Grid",
@@ -251,10 +251,15 @@ class GUI():
             pass
 
     def update(self, _time_delta):
-        """Draws the GUI."""
-        self.position_draw()
+        """Draws the GUI.
+
+        Returns a list of the rects drawn to the screen.
+        """
+        _dirty_rects = self.position_draw()
         self.manager.update(_time_delta)
         self.manager.draw_ui(self.screen)
+        _dirty_rects += [_element.rect for _element in self.manager.get_sprite_group()]
+        return _dirty_rects
 
     def input(self, _event):
         """Handles pygame_gui input events."""
@@ -373,15 +378,31 @@ class GUI():
                                                 object_id="done_button")
 
     def position_draw(self):
-        """Draw the lines that depict the robot's path historically."""
+        """Draw the lines that depict the robot's path historically.
+
+        Returns a list of the rects drawn to the screen.
+        """
+        _dirty_rects = []
+
+        def to_screen(_path):
+            """Converts a list of world positions to a list of screen positions."""
+            # Copy the list first, as the mapping worker may be adding to it
+            _path = np.asarray(list(_path), dtype=np.float64).reshape(-1, 2)
+            return np.column_stack(self.world.camera.to_screen(_path[:, 0], _path[:, 1])).tolist()
+
         if self.draw_positions:
             try:
-                pygame.draw.lines(self.screen, (255, 0, 0),
-                                  False, self.robot.truth_pos)
-                pygame.draw.lines(self.screen, (0, 0, 255),
-                                  False, self.slam.odo_pos)
+                _dirty_rects.append(pygame.draw.lines(self.screen, (255, 0, 0),
+                                                      False, to_screen(self.robot.truth_pos)))
+                _dirty_rects.append(pygame.draw.lines(self.screen, (0, 0, 255),
+                                                      False, to_screen(self.slam.odo_pos)))
             except ValueError:
                 pass
+            # Only SLAM types that correct the odometry have a separate position estimate
+            if len(self.slam.estimate_pos) > 1:
+                _dirty_rects.append(pygame.draw.lines(self.screen, (0, 160, 0),
+                                                      False, to_screen(self.slam.estimate_pos)))
+        return _dirty_rects
 
     def toggle_positions(self):
         """Toggle whether or not the robot's historical path is visualised."""
@@ -443,20 +464,20 @@ class GUI():
                                                              _bh_pos[1])])
             return _return.any()
 
-        def world_editor_centre_hover(_ch_pos):
-            """Return true if the position is within where the robot will spawn."""
-            _hor_cen = self.screen.get_width() / 2
-            _vert_cen = self.screen.get_height() / 2
+        def world_editor_centre_hover(_ch_x, _ch_y):
+            """Return true for the screen positions that are within where the robot will spawn."""
+            _ch_x, _ch_y = self.world.camera.to_world(np.asarray(_ch_x), np.asarray(_ch_y))
+            _hor_cen, _vert_cen = self.world.spawn_point()
             _robot_size = self.robot.robot.robot_size
-            _return = np.array([_ch_pos[0] > _hor_cen - _robot_size,
-                                _ch_pos[0] < _hor_cen + _robot_size,
-                                _ch_pos[1] < _vert_cen + _robot_size,
-                                _ch_pos[1] > _vert_cen - _robot_size])
-            return _return.all()
+            return ((_ch_x > _hor_cen - _robot_size)
+                    & (_ch_x < _hor_cen + _robot_size)
+                    & (_ch_y < _vert_cen + _robot_size)
+                    & (_ch_y > _vert_cen - _robot_size))
 
-        def pos_to_grid(_pos):
-            """Converts game space coordinates to world map grid coordinates."""
-            return int(_pos / self.world.size)
+        def pos_to_grid(_x, _y):
+            """Converts screen coordinates to world map grid coordinates."""
+            _x, _y = self.world.camera.to_world(np.asarray(_x), np.asarray(_y))
+            return (_x // self.world.size).astype(int), (_y // self.world.size).astype(int)
 
         if _mouse_click:
             if self.world.world_type == "Occupancy Grid" or not self.we_draw_mode:
@@ -468,35 +489,25 @@ class GUI():
                 else:
                     _last_point_dis = 0
                 # If clicking on a button don't draw anything
-                if (_last_point_dis < 8 and world_editor_button_hover(_pos)) or _last_point_dis == 0:
-                    _line = []
-                else:
-                    _line = utils.line_between(self.last_mouse_pos[0],
-                                               self.last_mouse_pos[1],
-                                               _pos[0], _pos[1])
-                # Write to the grid map all the points on the line if not in the spawn space
-                for _point in _line:
-                    if not world_editor_centre_hover(_point):
-                        self.world.write_to_map(self.we_draw_mode,
-                                                pos_to_grid(_point[0]),
-                                                pos_to_grid(_point[1]))
+                if not ((_last_point_dis < 8 and world_editor_button_hover(_pos))
+                        or _last_point_dis == 0):
+                    _xs, _ys, _ = utils.lines_between(self.last_mouse_pos[0],
+                                                      self.last_mouse_pos[1],
+                                                      _pos[0], _pos[1])
+                    # Write to the grid map all the points on the line if not in the spawn space
+                    _outside = ~world_editor_centre_hover(_xs, _ys)
+                    self.world.write_to_map(self.we_draw_mode,
+                                            *pos_to_grid(_xs[_outside], _ys[_outside]))
                 self.last_mouse_pos = _pos
             elif self.world.world_type == "Landmarks":
                 # If in landmark mode, only place one wall per click
                 if self.we_raise_click:
-                    if not world_editor_centre_hover(_pos):
+                    if not world_editor_centre_hover(_pos[0], _pos[1]):
                         self.world.write_to_map(self.we_draw_mode,
-                                                pos_to_grid(_pos[0]),
-                                                pos_to_grid(_pos[1]))
+                                                *pos_to_grid(_pos[0], _pos[1]))
                         self.we_raise_click = False
 
-        for i in range(len(self.world.grid)):
-            for j in range(len(self.world.grid[0])):
-                if self.world.grid[i][j]:
-                    pygame.draw.rect(self.screen,
-                                     (0, 0, 0),
-                                     pygame.Rect((j * self.world.size, i * self.world.size),
-                                                 (self.world.size, self.world.size)))
+        self.world.draw()
 
     def reset(self):
         """Reset the game state."""
@@ -0,0 +1,124 @@
+import os
+from collections import defaultdict
+import numpy as np
+import pygame
+from slam_visualiser import World, RobotControl, SLAM
+
+
+class Simulation():
+    """Runs the simulation without a display.
+
+    Drives the world, robot and SLAM classes from a scripted sequence of key presses instead of
+    user input, as fast as possible. Nothing is drawn and there is no frame rate limit, but each
+    step is the same as one tick of the simulation in Game.main. SLAM always runs on the calling
+    thread, never on a background mapping worker, so every step's estimate is final.
+
+    Attributes:
+        _world_type: The type of world map to simulate, "Occupancy Grid" or "Landmarks".
+        _screen_size: The size of the (never displayed) screen the world is sized from.
+        _seed: If given, seeds the random landmark positions, odometry noise and particle
+            filter so that runs with the same seed and commands give the same results.
+        _slam_type: The SLAM type, as chosen from the main menu, "Occupancy Grid",
+            "Particle Filter" or "Scan Matcher".
+        _map_path: If given, the grid file, or the YAML file of a ROS map_server map, the world
+            map is loaded from instead of the default map.
+        _record_path: If given, the path of a log file to record the simulation's scans and poses
+            to, until the end of Simulation.run.
+    """
+
+    # The keys that RobotControl.convert_key responds to
+    keys = {"LEFT": pygame.K_LEFT,
+            "RIGHT": pygame.K_RIGHT,
+            "UP": pygame.K_UP,
+            "DOWN": pygame.K_DOWN}
+
+    def __init__(self, _world_type="Occupancy Grid", _screen_size=(1280, 720), _seed=None,
+                 _slam_type="Occupancy Grid", _map_path=None, _record_path=None):
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        pygame.init()
+        self.screen = pygame.Surface(_screen_size)
+
+        self.world = World(self.screen)
+        self.world.world_type = _world_type
+        self.robot = RobotControl(self.screen, self.world)
+        self.slam = SLAM(self.screen, self.robot)
+        self.slam.slam_type = _slam_type
+        if _seed is not None:
+            self.world.random.seed(_seed)
+            self.slam.seed(_seed)
+        if _map_path is not None:
+            self.world.open_map(_map_path)
+            # The robot starts in the middle of the world and the occupancy grid covers all of
+            # it, both of which may have changed with the world's size
+            self.robot.robot.reset()
+            self.slam.reset()
+        else:
+            self.world.write_map(self.robot.robot.robot_size)
+        self.world.create_sprites()
+        self.robot.robot.setup_lasers()
+        self.robot.update()
+        if _record_path is not None:
+            self.slam.start_recording(_record_path)
+
+        # Unlike RobotControl.truth_pos and SLAM.odo_pos these aren't capped in length
+        self.truth_pos = []
+        self.odo_pos = []
+        self.estimate_pos = []
+
+    def step(self, _pressed):
+        """Simulate a single frame.
+
+        Attributes:
+            _pressed: A collection of the names of the keys held down this frame, from
+                Simulation.keys.
+        """
+        _keys = defaultdict(bool)
+        for _name in _pressed:
+            _keys[self.keys[_name]] = True
+        self.robot.change_velocity(_keys)
+        self.robot.update()
+        self.slam.tick(self.robot.odo_velocity,
+                       self.robot.robot.due_scan(),
+                       (self.robot.robot.x_pos, self.robot.robot.y_pos))
+        self.truth_pos.append([self.robot.robot.x_pos, self.robot.robot.y_pos])
+        self.odo_pos.append([self.slam.odo_x, self.slam.odo_y])
+        self.estimate_pos.append(list(self.slam.pose()))
+
+    def run(self, _commands):
+        """Simulate a sequence of commands and return the results, then stop recording if the
+        simulation is being recorded.
+
+        Attributes:
+            _commands: A sequence of (pressed, frames) pairs, where pressed is a collection of the
+                names of the keys to hold down, from Simulation.keys, for that number of frames.
+        """
+        for _pressed, _frames in _commands:
+            for _ in range(_frames):
+                self.step(_pressed)
+        self.slam.stop_recording()
+        return self.results()
+
+    def results(self):
+        """Return the trajectories and maps of the simulation so far.
+
+        Returns:
+            A dictionary of the true, odometry and SLAM estimated trajectories as (frames, 2)
+            arrays of positions, the SLAM occupancy grid as an array of probabilities and a copy
+            of the world grid.
+        """
+        return {"truth_pos": np.array(self.truth_pos, dtype=np.float64).reshape(-1, 2),
+                "odo_pos": np.array(self.odo_pos, dtype=np.float64).reshape(-1, 2),
+                "estimate_pos": np.array(self.estimate_pos, dtype=np.float64).reshape(-1, 2),
+                "map": self.slam.probability(),
+                "world": self.world.grid.copy()}
+
+
+if __name__ == '__main__':
+    _results = Simulation().run([(("UP",), 60),
+                                 (("UP", "LEFT"), 30),
+                                 (("UP",), 60),
+                                 (("RIGHT",), 15),
+                                 (("UP",), 90)])
+    _error = np.linalg.norm(_results["truth_pos"] - _results["odo_pos"], axis=1)
+    print("Frames simulated: {}".format(len(_results["truth_pos"])))
+    print("Final odometry error: {:.2f} pixels".format(_error[-1]))
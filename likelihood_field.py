@@ -0,0 +1,152 @@
+import collections
+import numpy as np
+from chunked_grid import ChunkedGrid
+
+
+class LikelihoodField():
+    """Distance from every cell of an occupancy grid to the nearest occupied cell.
+
+    Used to score how well a scan fits a map: a laser end-point close to an obstacle is likely,
+    and one far from any obstacle is not. The distances are a Euclidean distance transform capped
+    at a maximum distance. Every distance starts at the maximum, as for an empty grid, and because
+    of the cap a change to a cell only affects the distances within that maximum distance of it,
+    so only the tiles of the grid around changed cells are ever recomputed. The distances are
+    stored in a ChunkedGrid, so space that is far from every obstacle, including all unexplored
+    space, takes no memory.
+
+    Attributes:
+        _shape: The (rows, columns) shape of the occupancy grid.
+        _cell_size: The width of each grid cell in pixels.
+        _max_distance: The distance, in cells, that distances are capped at.
+        _sigma: The standard deviation of a laser end-point's distance to an obstacle, in pixels.
+    """
+
+    def __init__(self, _shape, _cell_size, _max_distance=8, _sigma=5.0):
+        self.cell_size = _cell_size
+        self.max_distance = _max_distance
+        self.sigma = _sigma
+        self.z_hit = 0.9  # Weight of the obstacle distance model of a laser end-point
+        self.z_random = 0.1  # Weight of a uniform model of random measurements
+        self.tile_size = 16
+        self.distance = ChunkedGrid(_shape, _max_distance)
+        self.version = 0  # Increased every time the distances change
+        # The (version, windows) of the most recent updates, where windows is a list of the
+        # (top, left, bottom, right) of each window of distances the update changed. Anything
+        # derived from the distances, like ScanMatcher's pyramid, can follow them incrementally.
+        self.changes = collections.deque(maxlen=64)
+
+    def update(self, _grid, _threshold, _rows, _cols):
+        """Recompute the distances around cells that have changed.
+
+        Each tile of the grid containing a changed cell is recomputed, along with a border of the
+        maximum distance around it, from the occupancy within twice that distance. Only those
+        windows of the grid are read.
+
+        Attributes:
+            _grid: The occupancy grid, where cells greater than _threshold are occupied.
+            _threshold: The value above which a cell is occupied.
+            _rows: An array of the rows of the cells whose occupancy changed.
+            _cols: An array of the columns of the cells whose occupancy changed.
+        """
+        _border = self.max_distance
+        _windows = []
+        _tiles = set(zip((np.asarray(_rows) // self.tile_size).tolist(),
+                         (np.asarray(_cols) // self.tile_size).tolist()))
+        for _tile_row, _tile_col in _tiles:
+            _top = max(_tile_row * self.tile_size - _border, 0)
+            _left = max(_tile_col * self.tile_size - _border, 0)
+            _bottom = min((_tile_row + 1) * self.tile_size + _border, _grid.shape[0])
+            _right = min((_tile_col + 1) * self.tile_size + _border, _grid.shape[1])
+            _in_top = max(_top - _border, 0)
+            _in_left = max(_left - _border, 0)
+            _window = self.distance_transform(_grid[_in_top:_bottom + _border,
+                                                    _in_left:_right + _border] > _threshold)
+            self.distance[_top:_bottom, _left:_right] = _window[_top - _in_top:_bottom - _in_top,
+                                                                _left - _in_left:_right - _in_left]
+            _windows.append((_top, _left, _bottom, _right))
+        self.version += 1
+        self.changes.append((self.version, _windows))
+
+    def changes_since(self, _version):
+        """Return the (top, left, bottom, right) windows of the distances that have changed since
+        a version, or None if the updates since it are too old to still be kept."""
+        if _version == self.version:
+            return []
+        # Every version is one update, so every update since _version must be kept
+        if not self.changes or self.changes[0][0] > _version + 1:
+            return None
+        return [_window for _changed, _windows in self.changes if _changed > _version
+                for _window in _windows]
+
+    def distance_transform(self, _occupied):
+        """Euclidean distance transform of a boolean array, capped at the maximum distance.
+
+        The squared distance to the nearest occupied cell is found separably: first the vertical
+        distance to the nearest occupied cell in the same column, then the minimum over nearby
+        columns of the horizontal distance squared plus that column's vertical distance squared.
+        Both passes only look the maximum distance either way, as one array operation per offset.
+        """
+        _cap = self.max_distance
+        _cap_squared = np.float32(_cap * _cap)
+        _rows, _cols = _occupied.shape
+
+        _vertical = np.where(_occupied, np.float32(0), _cap_squared)
+        for _offset in range(1, _cap + 1):
+            if _offset >= _rows:
+                break
+            _offset_squared = np.float32(_offset * _offset)
+            _below = np.where(_occupied[_offset:], _offset_squared, _cap_squared)
+            _vertical[:-_offset] = np.minimum(_vertical[:-_offset], _below)
+            _above = np.where(_occupied[:-_offset], _offset_squared, _cap_squared)
+            _vertical[_offset:] = np.minimum(_vertical[_offset:], _above)
+
+        _squared = _vertical.copy()
+        for _offset in range(1, _cap + 1):
+            if _offset >= _cols:
+                break
+            _offset_squared = np.float32(_offset * _offset)
+            _squared[:, :-_offset] = np.minimum(_squared[:, :-_offset],
+                                                _vertical[:, _offset:] + _offset_squared)
+            _squared[:, _offset:] = np.minimum(_squared[:, _offset:],
+                                               _vertical[:, :-_offset] + _offset_squared)
+        return np.minimum(np.sqrt(_squared), np.float32(_cap))
+
+    def score(self, _poses, _ranges, _angles, _max_range):
+        """Score a scan from many candidate poses at once.
+
+        The end-points of all lasers that hit something are found from every pose, and their
+        distances to the nearest obstacle are looked up in a single gather. End-points outside of
+        the grid count as being the maximum distance from any obstacle.
+
+        Attributes:
+            _poses: An array of (x, y) positions in pixels, or (x, y, heading) with the heading in
+                radians added to every laser's angle, one row per pose.
+            _ranges: An array of laser ranges in pixels.
+            _angles: An array of laser angles in radians.
+            _max_range: The range returned by lasers that didn't hit anything.
+
+        Returns:
+            An array of the log-likelihood of the scan from each pose.
+        """
+        _poses = np.asarray(_poses, dtype=np.float64)
+        _hit = _ranges < _max_range
+        _ranges = _ranges[_hit]
+        _angles = _angles[_hit]
+        if _poses.shape[1] > 2:
+            _angles = _angles + _poses[:, 2:3]
+        _cols = ((_poses[:, 0:1] + _ranges * np.cos(_angles)) // self.cell_size).astype(np.int64)
+        _rows = ((_poses[:, 1:2] + _ranges * np.sin(_angles)) // self.cell_size).astype(np.int64)
+        _inside = ((_rows >= 0) & (_rows < self.distance.shape[0])
+                   & (_cols >= 0) & (_cols < self.distance.shape[1]))
+        _distance = np.full(_rows.shape, self.max_distance, dtype=np.float64)
+        _distance[_inside] = self.distance[_rows[_inside], _cols[_inside]]
+        return self.log_likelihood(_distance).sum(axis=1)
+
+    def log_likelihood(self, _distance):
+        """Return the log-likelihood of laser end-points at distances, in cells, from obstacles.
+
+        A chance of random measurements is mixed in so that a few lasers ending in unmapped space
+        can't outweigh the rest of the scan.
+        """
+        return np.log(self.z_hit * np.exp(-0.5 * np.square(_distance * self.cell_size / self.sigma))
+                      + self.z_random)
@@ -0,0 +1,222 @@
+import os
+import struct
+import numpy as np
+
+# The number of rows of a grid file unpacked at a time, which bounds the temporary memory used
+GRID_UNPACK_ROWS = 1024
+# Header of a grid file: magic, format version, cell size in pixels, rows and columns, padded
+# to a fixed size so the bit-packed rows that follow start at a known offset.
+GRID_MAGIC = b"SLAMGRID"
+GRID_VERSION = 1
+GRID_HEADER = struct.Struct("<8sHHII")
+GRID_HEADER_SIZE = 32
+
+
+class GridFile():
+    """A bit-packed occupancy grid file, memory-mapped rather than read.
+
+    Each row of the grid is stored as one bit per cell, padded to a whole byte, after a fixed size
+    header. Opening a file only reads the header and maps the rest, so even very large maps open
+    instantly, and only the parts of the grid that are unpacked are ever read from disk.
+
+    Attributes:
+        _path: The path of the grid file.
+    """
+
+    def __init__(self, _path):
+        with open(_path, "rb") as _file:
+            _header = _file.read(GRID_HEADER_SIZE)
+        if len(_header) < GRID_HEADER_SIZE:
+            raise ValueError("{} is too short to be a grid file".format(_path))
+        _magic, _version, self.cell_size, _rows, _cols = GRID_HEADER.unpack_from(_header)
+        if _magic != GRID_MAGIC:
+            raise ValueError("{} is not a grid file".format(_path))
+        if _version != GRID_VERSION:
+            raise ValueError("{} has unsupported grid file version {}".format(_path, _version))
+        self.shape = (_rows, _cols)
+        self.bits = np.memmap(_path,
+                              dtype=np.uint8,
+                              mode="r",
+                              offset=GRID_HEADER_SIZE,
+                              shape=(_rows, (_cols + 7) // 8))
+
+    def window(self, _top, _left, _bottom, _right):
+        """Unpack a rectangle of the grid, from row _top and column _left up to but not including
+        row _bottom and column _right, as an array of 1s and 0s.
+
+        Only the bytes covering the rectangle are read, and they are unpacked a band of rows at a
+        time straight into the returned array.
+        """
+        _bottom = min(_bottom, self.shape[0])
+        _right = min(_right, self.shape[1])
+        _first_byte = _left // 8
+        _last_byte = (_right + 7) // 8
+        _offset = _left - _first_byte * 8
+        _window = np.empty((max(_bottom - _top, 0), max(_right - _left, 0)), dtype=np.uint8)
+        for _row in range(_top, _bottom, GRID_UNPACK_ROWS):
+            _end = min(_row + GRID_UNPACK_ROWS, _bottom)
+            _bits = np.unpackbits(self.bits[_row:_end, _first_byte:_last_byte], axis=1)
+            _window[_row - _top:_end - _top] = _bits[:, _offset:_offset + _window.shape[1]]
+        return _window
+
+    def grid(self):
+        """Unpack the whole grid as an array of 1s and 0s."""
+        return self.window(0, 0, self.shape[0], self.shape[1])
+
+
+def save_grid(_path, _grid, _cell_size):
+    """Save an occupancy grid, where non-zero cells are occupied, as a bit-packed grid file."""
+    _grid = np.asarray(_grid)
+    with open(_path, "wb") as _file:
+        _file.write(GRID_HEADER.pack(GRID_MAGIC,
+                                     GRID_VERSION,
+                                     _cell_size,
+                                     _grid.shape[0],
+                                     _grid.shape[1]).ljust(GRID_HEADER_SIZE, b"\0"))
+        _file.write(np.packbits(_grid != 0, axis=1).tobytes())
+
+
+def load_grid(_path):
+    """Load a grid file.
+
+    Returns:
+        A tuple of the grid, as an array of 1s and 0s, and its cell size in pixels.
+    """
+    _file = GridFile(_path)
+    return _file.grid(), _file.cell_size
+
+
+def read_pgm(_path):
+    """Read a binary (P5) or plain (P2) PGM image as an array of grey levels, one row per line of
+    pixels from the top of the image."""
+    with open(_path, "rb") as _file:
+        _data = _file.read()
+    # The header is the magic, width, height and maximum grey level, separated by whitespace and
+    # comments, with a single whitespace character before the pixels
+    _fields = []
+    _position = 0
+    while len(_fields) < 4:
+        while _data[_position:_position + 1].isspace():
+            _position += 1
+        if _data[_position:_position + 1] == b"#":
+            _position = _data.index(b"\n", _position) + 1
+            continue
+        _start = _position
+        while _position < len(_data) and not _data[_position:_position + 1].isspace():
+            _position += 1
+        _fields.append(_data[_start:_position])
+    _magic = _fields[0]
+    _width, _height, _max_value = (int(_field) for _field in _fields[1:])
+    _dtype = np.dtype(np.uint8) if _max_value < 256 else np.dtype(">u2")
+    if _magic == b"P5":
+        _count = _width * _height
+        return np.frombuffer(_data, dtype=_dtype, count=_count,
+                             offset=_position + 1).reshape(_height, _width)
+    if _magic == b"P2":
+        return np.array(_data[_position:].split()[:_width * _height],
+                        dtype=np.int64).astype(_dtype).reshape(_height, _width)
+    raise ValueError("{} is not a PGM image".format(_path))
+
+
+def write_pgm(_path, _image):
+    """Write an array of grey levels from 0 to 255 as a binary (P5) PGM image."""
+    _image = np.asarray(_image, dtype=np.uint8)
+    with open(_path, "wb") as _file:
+        _file.write("P5\n{} {}\n255\n".format(_image.shape[1], _image.shape[0]).encode("ascii"))
+        _file.write(_image.tobytes())
+
+
+def read_map_yaml(_path):
+    """Read the flat "key: value" YAML file of a ROS map_server map.
+
+    Numbers are converted to ints or floats, and [a, b, c] lists to lists of numbers. Everything
+    else is kept as a string.
+    """
+    def _value(_text):
+        _text = _text.strip().strip("\"'")
+        for _type in (int, float):
+            try:
+                return _type(_text)
+            except ValueError:
+                pass
+        return _text
+
+    _values = {}
+    with open(_path) as _file:
+        for _line in _file:
+            _line = _line.split("#", 1)[0].strip()
+            if ":" not in _line:
+                continue
+            _key, _text = _line.split(":", 1)
+            _text = _text.strip()
+            if _text.startswith("[") and _text.endswith("]"):
+                _values[_key.strip()] = [_value(_item) for _item in _text[1:-1].split(",")]
+            else:
+                _values[_key.strip()] = _value(_text)
+    return _values
+
+
+def load_ros_map(_yaml_path, _cell_metres):
+    """Load a ROS map_server map as an occupancy grid of a given cell size.
+
+    A pixel is occupied if its occupancy, read from its grey level as map_server does, is above
+    the map's occupied threshold. Pixels of unknown occupancy count as free. The pixels are then
+    resampled to the grid's cells: when a cell covers several pixels it is occupied if any of them
+    are, so thin walls survive downsampling, and when it covers less than one pixel it takes the
+    pixel it falls in.
+
+    Attributes:
+        _yaml_path: The path of the map's YAML file, which names its image.
+        _cell_metres: The width of each grid cell in metres.
+
+    Returns:
+        The grid as an array of 1s and 0s.
+    """
+    _info = read_map_yaml(_yaml_path)
+    _image = read_pgm(os.path.join(os.path.dirname(_yaml_path), _info["image"]))
+    _max_value = 255 if _image.dtype == np.uint8 else 65535
+    # map_server reads white as free and black as occupied, unless the map is negated
+    if _info.get("negate", 0):
+        _threshold = _info.get("occupied_thresh", 0.65) * _max_value
+        _occupied = _image > _threshold
+    else:
+        _threshold = (1 - _info.get("occupied_thresh", 0.65)) * _max_value
+        _occupied = _image < _threshold
+
+    _scale = _cell_metres / _info["resolution"]  # Pixels per grid cell
+    _rows = max(int(round(_image.shape[0] / _scale)), 1)
+    _cols = max(int(round(_image.shape[1] / _scale)), 1)
+    # The first pixel of every cell. Cells smaller than a pixel repeat the same first pixel, which
+    # reduceat reads as just that pixel.
+    _row_starts = np.minimum((np.arange(_rows) * _scale).astype(np.int64), _image.shape[0] - 1)
+    _col_starts = np.minimum((np.arange(_cols) * _scale).astype(np.int64), _image.shape[1] - 1)
+    _occupied = np.maximum.reduceat(_occupied.view(np.uint8), _row_starts, axis=0)
+    return np.maximum.reduceat(_occupied, _col_starts, axis=1)
+
+
+def save_ros_map(_yaml_path, _probability, _resolution, _occupied, _free):
+    """Save an occupancy probability grid as a ROS map_server map.
+
+    Cells are written in map_server's trinary form: black if occupied, white if free and grey if
+    unknown. The image is saved next to the YAML file with the same name.
+
+    Attributes:
+        _yaml_path: The path of the YAML file to write.
+        _probability: An array of the probability of each cell being occupied.
+        _resolution: The width of each cell in metres.
+        _occupied: The probability above which a cell is occupied.
+        _free: The probability below which a cell is free.
+    """
+    _image = np.full(_probability.shape, 205, dtype=np.uint8)
+    _image[_probability < _free] = 254
+    _image[_probability > _occupied] = 0
+    _image_path = os.path.splitext(_yaml_path)[0] + ".pgm"
+    write_pgm(_image_path, _image)
+    # The origin is the pose of the bottom left cell, with y pointing up the image
+    with open(_yaml_path, "w") as _file:
+        _file.write("image: {}\n".format(os.path.basename(_image_path)))
+        _file.write("resolution: {}\n".format(_resolution))
+        _file.write("origin: [0.0, {}, 0.0]\n".format(-_probability.shape[0] * _resolution))
+        _file.write("negate: 0\n")
+        _file.write("occupied_thresh: 0.65\n")
+        _file.write("free_thresh: 0.196\n")
@@ -0,0 +1,97 @@
+import queue
+import threading
+
+
+class MappingWorker():
+    """Runs SLAM on a background thread, so the main thread only simulates motion and draws.
+
+    The main thread hands the worker a record of every simulation tick: the robot's movement,
+    which odometry adds noise to, the position of the scan that fell due that tick, if any, and
+    the robot's true position. Ticks are sent in batches through a bounded queue. While the queue
+    is full they are held back and sent with the next batch instead, so the main thread never
+    waits for the worker. Casting the lasers and updating the map are mostly NumPy operations,
+    which release the GIL, so they run alongside the main thread's drawing.
+
+    Every tick is run in order, so the estimate and map are the same as running SLAM on the main
+    thread, just later. If the worker falls so far behind that more than max_pending_scans scans
+    are held back, the oldest are skipped, although the movement of their ticks still isn't. If
+    SLAM raises an exception, the worker keeps taking ticks from the queue but stops running them,
+    and raises an error from the exception the next time it is handed a tick or stopped.
+
+    Attributes:
+        _slam: The SLAM object to run.
+        _queue_size: The number of batches of ticks that can wait for the worker.
+    """
+
+    def __init__(self, _slam, _queue_size=2):
+        self.slam = _slam
+        self.queue = queue.Queue(_queue_size)
+        self.pending = []  # (velocity, scan position, true position) of each tick held back
+        self.max_pending_scans = 5
+        self.map_version = 0  # Increased every time the worker adds a scan to the map
+        self.skipped_scans = 0
+        self.error = None  # The exception SLAM raised on the worker thread, if it has
+        self.thread = threading.Thread(target=self.run, name="MappingWorker", daemon=True)
+        self.thread.start()
+
+    def submit(self, _velocity, _scan_pose=None, _truth_pose=None):
+        """Hand the worker a simulation tick, as taken by SLAM.tick, without waiting for it."""
+        self.check()
+        # The robot keeps changing its velocity list after the tick, so send a copy of it
+        self.pending.append((tuple(_velocity), _scan_pose, _truth_pose))
+        _scans = [_index for _index, _tick in enumerate(self.pending) if _tick[1] is not None]
+        for _index in _scans[:-self.max_pending_scans]:
+            _velocity, _, _truth_pose = self.pending[_index]
+            self.pending[_index] = (_velocity, None, _truth_pose)
+            self.skipped_scans += 1
+        try:
+            self.queue.put_nowait(self.pending)
+        except queue.Full:
+            return
+        self.pending = []
+
+    def run(self):
+        """Run batches of ticks from the queue until given None."""
+        while True:
+            _ticks = self.queue.get()
+            try:
+                if _ticks is None:
+                    return
+                if self.error is None:
+                    for _velocity, _scan_pose, _truth_pose in _ticks:
+                        self.slam.tick(_velocity, _scan_pose, _truth_pose)
+                        if _scan_pose is not None:
+                            self.map_version += 1
+            except Exception as _error:
+                # Keep emptying the queue, so the main thread never waits for a dead worker
+                self.error = _error
+            finally:
+                self.queue.task_done()
+
+    def check(self):
+        """Raise an error if SLAM has raised an exception on the worker thread."""
+        if self.error is not None:
+            raise RuntimeError("SLAM failed on the mapping worker thread") from self.error
+
+    def clear(self):
+        """Discard every tick that hasn't been run yet, and wait for the batch being run to
+        finish."""
+        self.pending = []
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+            self.queue.task_done()
+        self.queue.join()
+
+    def stop(self):
+        """Run every tick handed to the worker, then stop its thread, raising an error if SLAM
+        raised an exception on it."""
+        if self.thread.is_alive():
+            if self.pending and self.error is None:
+                self.queue.put(self.pending)
+            self.queue.put(None)
+            self.thread.join()
+        self.pending = []
+        self.check()
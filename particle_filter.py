@@ -0,0 +1,68 @@
+import numpy as np
+
+
+class ParticleFilter():
+    """Grid based particle filter for estimating the robot's position.
+
+    Each particle is a hypothesis of the robot's position. The positions and weights of all of the
+    particles are stored as NumPy arrays so that every step of the filter is a handful of array
+    operations, no matter how many particles there are. The particles share the one occupancy grid
+    that SLAM builds, which is updated from the filter's estimate of the position, and are scored
+    against it with SLAM's likelihood field.
+
+    Attributes:
+        _x: The x position the particles start around, in pixels.
+        _y: The y position the particles start around, in pixels.
+        _count: The number of particles.
+        _rng: The NumPy random generator used to sample the particles.
+    """
+
+    def __init__(self, _x, _y, _count=500, _rng=None):
+        self.count = _count
+        self.rng = _rng if _rng is not None else np.random.default_rng()
+        self.initial_spread = 1.0  # Standard deviation of the starting positions in pixels
+        self.motion_floor = 0.05  # Noise added even while stationary, in pixels per tick
+        self.measurement_scale = 1.0  # How sharply scan scores separate the particle weights
+        self.resample_threshold = 0.5  # Fraction of effective particles that triggers resampling
+        self.reset(_x, _y)
+
+    def reset(self, _x, _y):
+        """Spread the particles around a position with equal weights."""
+        self.particles = self.rng.normal((_x, _y), self.initial_spread, size=(self.count, 2))
+        self.weights = np.full(self.count, 1 / self.count)
+
+    def predict(self, _movement, _error):
+        """Motion model: move every particle by a noisy sample of the odometry's movement.
+
+        Attributes:
+            _movement: The (x, y) movement measured by odometry this tick, in pixels.
+            _error: The odometry error, as a fraction of the movement in each axis.
+        """
+        _movement = np.asarray(_movement, dtype=np.float64)
+        _scale = np.abs(_movement) * _error + self.motion_floor
+        self.particles += self.rng.normal(_movement, _scale, size=(self.count, 2))
+
+    def update(self, _scores):
+        """Measurement update: reweight the particles by the log-likelihoods of a scan from each
+        particle's position, and resample them if needed."""
+        # Weights that have underflowed to zero stay negligible without taking the log of zero
+        _log_weights = (np.log(np.maximum(self.weights, np.finfo(np.float64).tiny))
+                        + self.measurement_scale * _scores)
+        _log_weights -= _log_weights.max()
+        self.weights = np.exp(_log_weights)
+        self.weights /= self.weights.sum()
+        if 1 / np.sum(np.square(self.weights)) < self.resample_threshold * self.count:
+            self.resample()
+
+    def resample(self):
+        """Systematic resampling, which draws all particles with a single random offset."""
+        _positions = (self.rng.random() + np.arange(self.count)) / self.count
+        _cumulative = np.cumsum(self.weights)
+        _cumulative[-1] = 1.0
+        _index = np.searchsorted(_cumulative, _positions)
+        self.particles = self.particles[_index]
+        self.weights = np.full(self.count, 1 / self.count)
+
+    def estimate(self):
+        """Return the weighted mean position of the particles."""
+        return self.weights @ self.particles
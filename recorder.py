@@ -0,0 +1,180 @@
+import struct
+import zlib
+import numpy as np
+
+# Header of a log file: magic, format version and the number of lasers in each scan, padded to a
+# fixed size. The angles of the lasers follow it, then the chunks of records.
+LOG_MAGIC = b"SLAMLOG\0"
+LOG_VERSION = 1
+LOG_HEADER = struct.Struct("<8sHI")
+LOG_HEADER_SIZE = 32
+# Header of each chunk: the kind of records in it, the number of records, the size of the records
+# as stored and whether they are compressed.
+CHUNK_HEADER = struct.Struct("<4sIII")
+POSE_CHUNK = b"POSE"
+SCAN_CHUNK = b"SCAN"
+
+# One pose record is written every simulation tick. The velocity is the true movement that
+# odometry measured that tick, so a log has everything needed to run SLAM on it again.
+POSE_RECORD = np.dtype([("tick", "<u4"),
+                        ("truth", "<f8", (2,)),
+                        ("odometry", "<f8", (2,)),
+                        ("estimate", "<f8", (2,)),
+                        ("velocity", "<f8", (2,))])
+
+
+def scan_record(_beams):
+    """Return the NumPy record type of a scan with a number of lasers, which is written every tick
+    a scan is taken: the position it was taken from and the range of each laser."""
+    return np.dtype([("tick", "<u4"), ("pose", "<f8", (2,)), ("ranges", "<f4", (_beams,))])
+
+
+class Recorder():
+    """Records a session's scans and poses to an append-only binary log file.
+
+    Records are fixed size and are collected in arrays in memory, so recording a tick only sets
+    one row of an array. Once an array is full it is appended to the file as a chunk, optionally
+    compressed, so a log can be read back even if the session ended without it being closed,
+    losing at most the last chunk of each kind.
+
+    Attributes:
+        _path: The path of the log file, which is overwritten.
+        _beam_angles: An array of the angle of each laser of the lidar, in radians.
+        _compress: Whether to compress the chunks with zlib, which makes the log smaller, but
+            means they have to be decompressed to be read rather than being memory-mapped.
+        _chunk_records: The number of records in each full chunk.
+    """
+
+    def __init__(self, _path, _beam_angles, _compress=False, _chunk_records=1024):
+        _beam_angles = np.asarray(_beam_angles, dtype="<f8")
+        self.compress = _compress
+        self.chunk_records = _chunk_records
+        self.tick = 0
+        self.poses = np.zeros(_chunk_records, dtype=POSE_RECORD)
+        self.pose_count = 0
+        self.scans = np.zeros(_chunk_records, dtype=scan_record(len(_beam_angles)))
+        self.scan_count = 0
+        self.file = open(_path, "wb")
+        self.file.write(LOG_HEADER.pack(LOG_MAGIC,
+                                        LOG_VERSION,
+                                        len(_beam_angles)).ljust(LOG_HEADER_SIZE, b"\0"))
+        self.file.write(_beam_angles.tobytes())
+
+    def record(self, _truth, _odometry, _estimate, _velocity, _scan_pose=None, _ranges=None):
+        """Record one simulation tick.
+
+        Attributes:
+            _truth: The robot's true (x, y) position.
+            _odometry: The odometry's (x, y) position.
+            _estimate: The (x, y) position SLAM estimated.
+            _velocity: The robot's true (x, y) movement this tick.
+            _scan_pose: The (x, y) position of the scan taken this tick, if any.
+            _ranges: An array of the ranges of the scan taken this tick, if any.
+        """
+        _pose = self.poses[self.pose_count]
+        _pose["tick"] = self.tick
+        _pose["truth"] = _truth
+        _pose["odometry"] = _odometry
+        _pose["estimate"] = _estimate
+        _pose["velocity"] = _velocity[:2]
+        self.pose_count += 1
+        if self.pose_count == self.chunk_records:
+            self.write_chunk(POSE_CHUNK, self.poses)
+            self.pose_count = 0
+        if _scan_pose is not None:
+            _scan = self.scans[self.scan_count]
+            _scan["tick"] = self.tick
+            _scan["pose"] = _scan_pose
+            _scan["ranges"] = _ranges
+            self.scan_count += 1
+            if self.scan_count == self.chunk_records:
+                self.write_chunk(SCAN_CHUNK, self.scans)
+                self.scan_count = 0
+        self.tick += 1
+
+    def write_chunk(self, _kind, _records):
+        """Append an array of records to the file as a chunk."""
+        _data = _records.tobytes()
+        if self.compress:
+            _data = zlib.compress(_data, 1)
+        self.file.write(CHUNK_HEADER.pack(_kind, len(_records), len(_data), self.compress))
+        self.file.write(_data)
+        self.file.flush()
+
+    def flush(self):
+        """Write the records collected so far to the file, as chunks that may not be full."""
+        if self.pose_count:
+            self.write_chunk(POSE_CHUNK, self.poses[:self.pose_count])
+            self.pose_count = 0
+        if self.scan_count:
+            self.write_chunk(SCAN_CHUNK, self.scans[:self.scan_count])
+            self.scan_count = 0
+
+    def close(self):
+        """Write the remaining records and close the file."""
+        self.flush()
+        self.file.close()
+
+
+class LogFile():
+    """A log file written by Recorder, memory-mapped rather than read.
+
+    Opening a log only reads the headers of its chunks. Uncompressed chunks are read as arrays of
+    records straight from the mapped file, and compressed ones are decompressed when they are
+    read. A chunk cut short, by a session that ended while it was being written, is ignored.
+
+    Attributes:
+        _path: The path of the log file.
+    """
+
+    def __init__(self, _path):
+        with open(_path, "rb") as _file:
+            _header = _file.read(LOG_HEADER_SIZE)
+        if len(_header) < LOG_HEADER_SIZE:
+            raise ValueError("{} is too short to be a log file".format(_path))
+        _magic, _version, _beams = LOG_HEADER.unpack_from(_header)
+        if _magic != LOG_MAGIC:
+            raise ValueError("{} is not a log file".format(_path))
+        if _version != LOG_VERSION:
+            raise ValueError("{} has unsupported log file version {}".format(_path, _version))
+        self.data = np.memmap(_path, dtype=np.uint8, mode="r")
+        self.beam_angles = np.frombuffer(self.data, dtype="<f8", count=_beams,
+                                         offset=LOG_HEADER_SIZE)
+        self.scan_record = scan_record(_beams)
+        # (kind, records, offset, size, compressed) of every complete chunk
+        self.chunks = []
+        _offset = LOG_HEADER_SIZE + self.beam_angles.nbytes
+        while _offset + CHUNK_HEADER.size <= len(self.data):
+            _kind, _count, _size, _compressed = CHUNK_HEADER.unpack_from(self.data, _offset)
+            _offset += CHUNK_HEADER.size
+            if _offset + _size > len(self.data):
+                break
+            self.chunks.append((_kind, _count, _offset, _size, _compressed))
+            _offset += _size
+
+    def chunk(self, _index):
+        """Return the records of a chunk as an array, which is read-only if it is mapped."""
+        _kind, _count, _offset, _size, _compressed = self.chunks[_index]
+        _dtype = POSE_RECORD if _kind == POSE_CHUNK else self.scan_record
+        if _compressed:
+            return np.frombuffer(zlib.decompress(self.data[_offset:_offset + _size]),
+                                 dtype=_dtype,
+                                 count=_count)
+        return np.frombuffer(self.data, dtype=_dtype, count=_count, offset=_offset)
+
+    def records(self, _kind):
+        """Return every record of a kind, from all of its chunks, as one array."""
+        _chunks = [self.chunk(_index) for _index, _chunk in enumerate(self.chunks)
+                   if _chunk[0] == _kind]
+        if len(_chunks) == 1:
+            return _chunks[0]
+        _dtype = POSE_RECORD if _kind == POSE_CHUNK else self.scan_record
+        return np.concatenate(_chunks) if _chunks else np.zeros(0, dtype=_dtype)
+
+    def poses(self):
+        """Return every tick's pose record."""
+        return self.records(POSE_CHUNK)
+
+    def scans(self):
+        """Return every scan record."""
+        return self.records(SCAN_CHUNK)
@@ -0,0 +1,182 @@
+import numpy as np
+import utils
+
+
+class ScanMatcher():
+    """Multi-resolution correlative scan matcher.
+
+    Refines a pose estimate by searching the poses around it for the one where a scan best fits
+    the map. Candidate poses are scored against a pyramid of lookup tables built from a
+    LikelihoodField, where each level halves the resolution of the one below by taking the maximum
+    of each 2x2 block of cells. The search starts with a coarse grid of candidates on the lowest
+    resolution level and repeatedly narrows in around the best candidate on finer levels, then
+    continues below the resolution of the map with finer steps on the full resolution table. The
+    result is only used if it fits the scan better than the estimate on the full resolution table.
+    As the map changes, only the blocks of the pyramid over the distances the likelihood field
+    recomputed are pooled again, unless the field has grown past the pyramid.
+
+    Attributes:
+        _levels: The number of levels in the map pyramid, including the full resolution table.
+    """
+
+    def __init__(self, _levels=3):
+        self.levels = _levels
+        self.search_window = 20.0  # How far from the estimate the search reaches, in pixels
+        self.heading_window = np.deg2rad(2)  # How far the search turns either way, in radians
+        self.heading_steps = 2  # Number of heading steps either side of the current heading
+        self.sub_cell_steps = 3  # Number of times the step size is halved below one cell
+        # Standard deviation of the estimate's error, which penalises candidates further from it
+        self.prior_sigma = 2.0
+        # Heading offsets are penalised as the distance they move a point this far away, in pixels
+        self.heading_lever = 100.0
+        self.pyramid = []
+        self.pyramid_origin = (0, 0)  # The (row, column) of the first cell of the pyramid
+        self.pyramid_version = None
+
+    def build_pyramid(self, _field):
+        """Build the max-pooled pyramid of log-likelihood tables from a likelihood field.
+
+        The pyramid only covers the part of the field near explored space, as cells further from
+        every obstacle all have the same, lowest, log-likelihood.
+        """
+        _top, _left, _bottom, _right = _field.distance.bounds()
+        # Align the origin to the coarsest level's cells, so each level's blocks line up
+        _block = 2 ** (self.levels - 1)
+        _top -= _top % _block
+        _left -= _left % _block
+        self.pyramid_origin = (_top, _left)
+        _table = _field.log_likelihood(_field.distance[_top:_bottom, _left:_right])
+        _table = _table.astype(np.float32)
+        self.outside = np.float32(_field.log_likelihood(_field.max_distance))
+        self.pyramid = [_table]
+        for _ in range(1, self.levels):
+            # Pad to an even size so every cell belongs to a whole 2x2 block
+            _rows = _table.shape[0] + _table.shape[0] % 2
+            _cols = _table.shape[1] + _table.shape[1] % 2
+            _padded = np.full((_rows, _cols), self.outside, dtype=np.float32)
+            _padded[:_table.shape[0], :_table.shape[1]] = _table
+            _table = _padded.reshape(_rows // 2, 2, _cols // 2, 2).max(axis=(1, 3))
+            self.pyramid.append(_table)
+        self.pyramid_version = _field.version
+
+    def update_pyramid(self, _field):
+        """Bring the pyramid up to date with a likelihood field, only pooling again the blocks of
+        each level over the windows of distances that have changed since it was built or updated.
+
+        The whole pyramid is built again if the changes aren't known, or reach outside of it.
+        """
+        _windows = None
+        if self.pyramid and self.pyramid_version is not None:
+            _windows = _field.changes_since(self.pyramid_version)
+        _origin_row, _origin_col = self.pyramid_origin
+        _rows, _cols = self.pyramid[0].shape if self.pyramid else (0, 0)
+        if _windows is None or any(_top < _origin_row or _left < _origin_col
+                                   or _bottom > _origin_row + _rows
+                                   or _right > _origin_col + _cols
+                                   for _top, _left, _bottom, _right in _windows):
+            self.build_pyramid(_field)
+            return
+        for _top, _left, _bottom, _right in _windows:
+            _top -= _origin_row
+            _left -= _origin_col
+            _bottom -= _origin_row
+            _right -= _origin_col
+            self.pyramid[0][_top:_bottom, _left:_right] = _field.log_likelihood(
+                _field.distance[_top + _origin_row:_bottom + _origin_row,
+                                _left + _origin_col:_right + _origin_col])
+            for _level in range(1, self.levels):
+                # The blocks of this level covering the window, from the whole blocks of cells
+                # below them, which run off the edge of the level below at its far edges
+                _top //= 2
+                _left //= 2
+                _bottom = -(-_bottom // 2)
+                _right = -(-_right // 2)
+                _below = self.pyramid[_level - 1][2 * _top:2 * _bottom, 2 * _left:2 * _right]
+                _pooled = utils.pool(_below, 2, np.max, self.outside)
+                self.pyramid[_level][_top:_bottom, _left:_right] = _pooled
+        self.pyramid_version = _field.version
+
+    def score(self, _level, _cell_size, _poses, _offset_x, _offset_y):
+        """Score a scan from many (x, y, heading) poses against one level of the pyramid.
+
+        Attributes:
+            _level: The index of the pyramid level to score against.
+            _cell_size: The width of the level's cells in pixels.
+            _poses: An array of (x, y, heading) poses, one row per pose.
+            _offset_x: An array of the x offsets of the laser end-points from the lidar, for each
+                heading in _poses, one row per pose.
+            _offset_y: The same as _offset_x for the y offsets.
+        """
+        _table = self.pyramid[_level]
+        _cols = ((_poses[:, 0:1] + _offset_x) // _cell_size).astype(np.int64)
+        _rows = ((_poses[:, 1:2] + _offset_y) // _cell_size).astype(np.int64)
+        _rows -= self.pyramid_origin[0] >> _level
+        _cols -= self.pyramid_origin[1] >> _level
+        _inside = (_rows >= 0) & (_rows < _table.shape[0]) & (_cols >= 0) & (_cols < _table.shape[1])
+        _values = np.full(_rows.shape, self.outside, dtype=np.float32)
+        _values[_inside] = _table[_rows[_inside], _cols[_inside]]
+        return _values.sum(axis=1)
+
+    def match(self, _field, _pose, _ranges, _angles, _max_range):
+        """Find the pose near an estimate where a scan best fits the map.
+
+        Attributes:
+            _field: The LikelihoodField of the map.
+            _pose: The (x, y, heading) estimate to search around, in pixels and radians.
+            _ranges: An array of laser ranges in pixels.
+            _angles: An array of laser angles in radians.
+            _max_range: The range returned by lasers that didn't hit anything.
+
+        Returns:
+            The best (x, y, heading) pose found.
+        """
+        if self.pyramid_version != _field.version or not self.pyramid:
+            self.update_pyramid(_field)
+        _hit = _ranges < _max_range
+        _ranges = _ranges[_hit]
+        _angles = _angles[_hit]
+        _estimate = np.asarray(_pose, dtype=np.float64)
+        if not len(_ranges):
+            return tuple(_estimate)
+
+        _best = _estimate
+        _heading_step = self.heading_window / max(self.heading_steps, 1)
+        _steps = ([_field.cell_size * 2 ** _level for _level in reversed(range(self.levels))]
+                  + [_field.cell_size / 2 ** _i for _i in range(1, self.sub_cell_steps + 1)])
+        for _i, _step in enumerate(_steps):
+            _level = max(self.levels - 1 - _i, 0)
+            # The first, coarsest, step covers the whole search window. Every step after searches
+            # one step of the level before either side of the best candidate so far.
+            _reach = self.search_window if _i == 0 else _steps[_i - 1]
+            _count = int(np.ceil(_reach / _step))
+            _linear = np.arange(-_count, _count + 1) * _step
+            _turns = np.arange(-self.heading_steps, self.heading_steps + 1) * _heading_step
+            _dx, _dy, _dh = np.meshgrid(_linear, _linear, _turns, indexing='ij')
+            _candidates = _best + np.column_stack((_dx.ravel(), _dy.ravel(), _dh.ravel()))
+            _offset = _candidates - _estimate
+            _within = ((np.abs(_offset[:, :2]) <= self.search_window).all(axis=1)
+                       & (np.abs(_offset[:, 2]) <= self.heading_window))
+            _candidates = _candidates[_within]
+            _offset = _offset[_within]
+
+            _beam_angles = _angles + _candidates[:, 2:3]
+            _scores = self.score(_level,
+                                 _field.cell_size * 2 ** _level,
+                                 _candidates,
+                                 _ranges * np.cos(_beam_angles),
+                                 _ranges * np.sin(_beam_angles))
+            _offset[:, 2] *= self.heading_lever
+            _scores -= 0.5 * np.square(_offset).sum(axis=1) / self.prior_sigma ** 2
+            _best = _candidates[np.argmax(_scores)]
+            _heading_step /= 2
+
+        _final = np.array([_best, _estimate])
+        _beam_angles = _angles + _final[:, 2:3]
+        _scores = self.score(0,
+                             _field.cell_size,
+                             _final,
+                             _ranges * np.cos(_beam_angles),
+                             _ranges * np.sin(_beam_angles))
+        if _scores[0] > _scores[1]:
+            return tuple(_best)
+        return tuple(_estimate)
@@ -0,0 +1,114 @@
+import contextlib
+import os
+import struct
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+
+# Header of a shared grid block: the seqlock's sequence number, the grid's rows and columns, its
+# NumPy data type and the creator's resource tracker, padded so the cells that follow are aligned.
+SHARED_HEADER = struct.Struct("<qqq8sqq")
+SHARED_HEADER_SIZE = 64
+
+
+def resource_tracker_id():
+    """Return the (device, inode) of the pipe to this process's resource tracker, which is the
+    same in every process that shares the tracker, such as those forked or spawned from one."""
+    _stat = os.fstat(resource_tracker.getfd())
+    return _stat.st_dev, _stat.st_ino
+
+
+class SharedGrid():
+    """A 2D grid of cells in a shared memory block, which other processes can read without copying.
+
+    The block starts with a header holding a sequence number, used as a seqlock, followed by the
+    cells, which start at zero. One process, the one that created the grid, writes to the grid, inside SharedGrid.writing, which
+    makes the sequence number odd while cells are being written and even again after. Any number
+    of processes can attach to the grid by its name and read it with SharedGrid.read, which runs a
+    function on the cells in place and runs it again if they were written to meanwhile, so the
+    result never comes from a half written grid. The sequence number rises by two with every
+    write, so half of it is the grid's version, which readers can compare to skip reading a grid
+    that hasn't changed.
+
+    Attributes:
+        _name: The name of the shared memory block to attach to, or to create if a shape is
+            given, in which case a unique name is chosen if it is None.
+        _shape: The (rows, columns) of a new grid, or None to attach to an existing one.
+        _dtype: The NumPy data type of a new grid's cells.
+    """
+
+    def __init__(self, _name=None, _shape=None, _dtype=np.float32):
+        self.owner = _shape is not None
+        if self.owner:
+            _rows, _cols = _shape
+            _dtype = np.dtype(_dtype)
+            _size = SHARED_HEADER_SIZE + _rows * _cols * _dtype.itemsize
+            self.memory = shared_memory.SharedMemory(name=_name, create=True, size=_size)
+            SHARED_HEADER.pack_into(self.memory.buf, 0,
+                                    0, _rows, _cols, _dtype.str.encode("ascii"),
+                                    *resource_tracker_id())
+        else:
+            # Only the creator frees the block, so a reader's resource tracker mustn't free it
+            # when the reader exits. Before Python 3.13 attaching always registers the block, so
+            # it is unregistered again, but only from a tracker other than the creator's. The
+            # creator's tracker holds a single registration of the block, shared by every process
+            # using the tracker, which has to stay for the creator to free the block, or for the
+            # tracker to free it if the creator dies without doing so.
+            if sys.version_info >= (3, 13):
+                self.memory = shared_memory.SharedMemory(name=_name, track=False)
+            else:
+                self.memory = shared_memory.SharedMemory(name=_name)
+            _, _rows, _cols, _dtype, *_tracker = SHARED_HEADER.unpack_from(self.memory.buf)
+            if sys.version_info < (3, 13) and tuple(_tracker) != resource_tracker_id():
+                resource_tracker.unregister(self.memory._name, "shared_memory")
+            _dtype = np.dtype(_dtype.rstrip(b"\0").decode("ascii"))
+        self.name = self.memory.name
+        self.sequence = np.ndarray((1,), dtype=np.int64, buffer=self.memory.buf)
+        self.array = np.ndarray((_rows, _cols),
+                                dtype=_dtype,
+                                buffer=self.memory.buf,
+                                offset=SHARED_HEADER_SIZE)
+
+    @property
+    def version(self):
+        """The number of writes made to the grid."""
+        return int(self.sequence[0]) // 2
+
+    @contextlib.contextmanager
+    def writing(self):
+        """Return a context to write to the cells in, as the array it yields.
+
+        Only one process, and one thread of it, may write to a grid.
+        """
+        self.sequence[0] += 1
+        try:
+            yield self.array
+        finally:
+            self.sequence[0] += 1
+
+    def read(self, _reader=np.copy):
+        """Return the result of a function of the cells, run while they weren't being written to.
+
+        The function is given the cells in place, so it should return a copy of any of them it
+        keeps, such as the whole array copied by the default.
+        """
+        while True:
+            _sequence = int(self.sequence[0])
+            if _sequence % 2:
+                time.sleep(0)  # Let the writer finish
+                continue
+            _result = _reader(self.array)
+            if int(self.sequence[0]) == _sequence:
+                return _result
+
+    def close(self):
+        """Detach from the shared memory block, and free it if this grid created it.
+
+        Every array of the cells, including SharedGrid.array, must be released before closing.
+        """
+        self.sequence = None
+        self.array = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
@@ -1,11 +1,22 @@
+import argparse
 import time
-import operator
 import random
+import collections
+import contextlib
+import threading
 import numpy as np
 import pygame
 import pygame_gui as pygui
 import utils
 import gui
+import map_io
+from particle_filter import ParticleFilter
+from likelihood_field import LikelihoodField
+from scan_matcher import ScanMatcher
+from chunked_grid import ChunkedGrid
+from mapping_worker import MappingWorker
+from shared_grid import SharedGrid
+from recorder import Recorder
 import copy
 
 
@@ -14,9 +25,16 @@ class Game():
 
     Creates the game screen. Contains the main game loop which handles the order of execution of
     robot and SLAM functionality.
+
+    Attributes:
+        _record_path: If given, the path of a log file to record the simulation's scans and poses
+            to.
+        _map_path: If given, the grid file, or the YAML file of a ROS map_server map, the world
+            map is loaded from instead of the default map. The world takes the map's size, which
+            may be much larger than the screen.
     """
 
-    def __init__(self):
+    def __init__(self, _record_path=None, _map_path=None):
         # pygame setup
         pygame.init()
         pygame.key.set_repeat(300, 30)
@@ -39,87 +57,171 @@ class Game():
         self.robot = RobotControl(self.screen, self.world)
         self.slam = SLAM(self.screen, self.robot)
         self.gui = gui.GUI(self.screen, self.world, self.robot, self.slam)
+        self.map_path = _map_path
+        if self.map_path is not None:
+            self.world.open_map(self.map_path)
+            # The robot starts in the middle of the world and the occupancy grid covers all of
+            # it, both of which may have changed with the world's size
+            self.robot.robot.reset()
+            self.slam.reset()
 
         self.font = pygame.font.Font(None, 30)
 
+        # The simulation runs in fixed ticks of simulated time, however fast frames are drawn
+        self.frame_rate = 60  # Maximum frames drawn per second
+        self.time_scale = 1.0  # Simulated seconds per real second
+        # Longest real time simulated in one frame, so a slow frame doesn't leave the simulation
+        # ever further behind
+        self.max_frame_time = 0.25
+        # Run SLAM on a background thread, so a slow scan or map update doesn't hold up frames
+        self.background_mapping = True
+        self.record_path = _record_path
+
         self.state = 0
         self.main()
 
     def main(self):
         """Main game loop."""
         _playing_game = True
-        _world_edited = False
-        while _playing_game:
-            _time_delta = self.clock.tick(30) / 1000.0
-            self.screen.blit(self.background, (0, 0))
-            for _event in pygame.event.get():
-                if _event.type == pygame.QUIT:
-                    _playing_game = False
-                    break
-                if _event.type == pygame.USEREVENT:
-                    self.gui.input(_event)
-                if _event.type == pygame.MOUSEBUTTONUP:
-                    self.gui.last_mouse_pos = None
-                    self.gui.we_raise_click = True
-                if _event.type == pygame.KEYDOWN:
-                    if _event.key == pygame.K_r:
-                        self.gui.reset()
-                self.gui.manager.process_events(_event)
-
-            # Main Menu
-            if self.state == 0:
-                if self.gui.main_menu_state == 0:
-                    self.state += 1
-                    self.gui.setup_game(_world_edited)
-                    self.init_game()
-                elif self.gui.main_menu_state == 2:
-                    self.state = 2
-                    _world_edited = True
-                    self.gui.kill_main_menu()
-                    self.gui.world_editor_setup()
+        # A loaded map is kept rather than replaced by the default map
+        _world_edited = self.map_path is not None
+        _last_dirty_rects = []
+        _accumulator = 0.0  # Simulated time owed to the simulation, in seconds
+        # Always close the log and free shared memory, even if SLAM failed on the mapping worker,
+        # whose error is raised once they are
+        try:
+            while _playing_game:
+                _time_delta = self.clock.tick(self.frame_rate) / 1000.0
+                if self.state == 0:
+                    # The simulation and world editor start each frame by drawing the world instead
+                    self.screen.blit(self.background, (0, 0))
+                # Only the areas drawn over this frame or last frame need updating on the display,
+                # unless something like a GUI action may have changed the whole screen
+                _dirty_rects = []
+                _full_update = self.state != 1
+                for _event in pygame.event.get():
+                    if _event.type == pygame.QUIT:
+                        _playing_game = False
+                        break
+                    if _event.type == pygame.USEREVENT:
+                        self.gui.input(_event)
+                        _full_update = True
+                    if _event.type == pygame.MOUSEBUTTONUP:
+                        self.gui.last_mouse_pos = None
+                        self.gui.we_raise_click = True
+                    if _event.type == pygame.MOUSEWHEEL and self.state == 1:
+                        # Each step of the wheel doubles or halves the zoom
+                        self.world.camera.set_zoom(self.world.camera.zoom * 2 ** _event.y)
+                    if _event.type == pygame.KEYDOWN:
+                        if _event.key == pygame.K_r:
+                            self.gui.reset()
+                            _full_update = True
+                        elif _event.key == pygame.K_RIGHTBRACKET:
+                            self.time_scale = min(self.time_scale * 2, 16)
+                        elif _event.key == pygame.K_LEFTBRACKET:
+                            self.time_scale = max(self.time_scale / 2, 1 / 16)
+                    self.gui.manager.process_events(_event)
+
+                # Main Menu
+                if self.state == 0:
+                    if self.gui.main_menu_state == 0:
+                        self.state += 1
+                        self.gui.setup_game(_world_edited)
+                        self.init_game()
+                        _full_update = True
+                    elif self.gui.main_menu_state == 2:
+                        self.state = 2
+                        _world_edited = True
+                        self.gui.kill_main_menu()
+                        self.gui.world_editor_setup()
+                    else:
+                        # The particle filter maps the same kind of world as the occupancy grid
+                        self.slam.slam_type = self.gui.slam_type_drop.selected_option
+                        if self.slam.slam_type == "Landmarks":
+                            self.world.world_type = "Landmarks"
+                        else:
+                            self.world.world_type = "Occupancy Grid"
+
+                # Simulation
+                elif self.state == 1:
+                    # Run as many whole ticks as the time passed owes, carrying the remainder over
+                    # to the next frame, so the simulation is the same whatever the frame rate
+                    _accumulator += min(_time_delta, self.max_frame_time) * self.time_scale
+                    _tick_time = 1 / self.robot.tick_rate
+                    while _accumulator >= _tick_time:
+                        self.step(pygame.key.get_pressed())
+                        _accumulator -= _tick_time
+                    _alpha = _accumulator / _tick_time
+
+                    # The whole screen changes when the camera moves to follow the robot
+                    self.world.follow(*self.robot.interpolated_pos(_alpha))
+                    _full_update = _full_update or self.world.camera.moved
+                    self.world.camera.moved = False
+                    self.world.draw()
+                    _dirty_rects += self.slam.update()
+                    _dirty_rects += self.robot.draw(_alpha)
+
+                # World Editor
+                elif self.state == 2:
+                    if self.gui.main_menu_state == 1:
+                        self.state = 0
+                        self.gui.main_menu()
+                        self.gui.kill_world_editor()
+                    self.gui.world_editor(pygame.mouse.get_pressed()[0],
+                                          pygame.mouse.get_pos())
+
+                _fps = self.font.render(str(int(self.clock.get_fps())),
+                                        True,
+                                        pygame.Color('green'))
+                _dirty_rects.append(self.screen.blit(_fps, (3, 3)))
+                _dirty_rects += self.gui.update(_time_delta)
+                if _full_update:
+                    pygame.display.update()
                 else:
-                    self.world.world_type = self.gui.slam_type_drop.selected_option
-
-            # Simulation
-            elif self.state == 1:
-                self.robot.change_velocity(pygame.key.get_pressed())
-                self.world.draw()
-                self.slam.update()
-                self.robot.update()
-                self.slam.odometry(self.robot.odo_velocity)
-                if self.robot.robot.new_sample:
-                    self.slam.occupancy_grid()
-                    self.robot.robot.new_sample = False
-
-            # World Editor
-            elif self.state == 2:
-                if self.gui.main_menu_state == 1:
-                    self.state = 0
-                    self.gui.main_menu()
-                    self.gui.kill_world_editor()
-                self.gui.world_editor(pygame.mouse.get_pressed()[0],
-                                      pygame.mouse.get_pos())
-
-            _fps = self.font.render(str(int(self.clock.get_fps())),
-                                    True,
-                                    pygame.Color('green'))
-            self.screen.blit(_fps, (3, 3))
-            self.gui.update(_time_delta)
-            pygame.display.update()
-
-        pygame.quit()
+                    pygame.display.update(_dirty_rects + _last_dirty_rects)
+                _last_dirty_rects = _dirty_rects
+        finally:
+            try:
+                self.slam.stop_worker()
+            finally:
+                self.slam.stop_recording()
+                self.slam.unshare_grid()
+                self.world.unshare_grid()
+                pygame.quit()
+
+    def step(self, _keys):
+        """Advance the simulation by one tick.
+
+        The robot's motion is simulated here, and SLAM is either run for the tick straight away or
+        handed to the background mapping worker.
+
+        Attributes:
+            _keys: The state of every key, as returned by pygame.key.get_pressed.
+        """
+        self.robot.change_velocity(_keys)
+        self.robot.update()
+        _truth_pose = (self.robot.robot.x_pos, self.robot.robot.y_pos)
+        if self.slam.worker is not None:
+            self.slam.worker.submit(self.robot.odo_velocity,
+                                    self.robot.robot.due_scan(),
+                                    _truth_pose)
+        else:
+            self.slam.tick(self.robot.odo_velocity, self.robot.robot.due_scan(), _truth_pose)
 
     def init_game(self):
         self.robot.robot.setup_lasers()
         self.robot.update()
+        if self.record_path is not None:
+            self.slam.start_recording(self.record_path)
+        if self.background_mapping:
+            self.slam.start_worker()
 
 
 class Robot(pygame.sprite.Sprite):
     """Sprite  the robot player object.
 
-    Handles the attributes of the robot, including its collision mask. Also handles robot state
-    updates including translational and rotational changes. This class also contains the lidar
-    sensor calculations.
+    Handles the attributes of the robot. Also handles robot state updates including translational
+    and rotational changes. This class also contains the lidar sensor calculations.
 
     Attributes:
         _p_screen: The main pygame screen surface.
@@ -138,43 +240,49 @@ class Robot(pygame.sprite.Sprite):
         self.image_size = self.image.get_size()
         self.og_image = self.image.copy()
         self.rect = self.image.get_rect()
-        self.x_pos = float(self.screen.get_size()[0] / 2)
-        self.y_pos = float(self.screen.get_size()[1] / 2)
+        self.x_pos, self.y_pos = self.world.spawn_point()
         self.angle = 0
         self.rect.center = (self.x_pos, self.y_pos)
         self.hitbox = pygame.Rect(self.x_pos - (self.image_size[0] / 2),
                                   self.y_pos - (self.image_size[1] / 2),
                                   self.image_size[0] + 2,
                                   self.image_size[1] + 2)
-        self.mask = pygame.mask.from_surface(self.image)
+        # Rotated images of the robot by heading, least recently used first
+        self.rotations = collections.OrderedDict()
+        self.rotation_cache_size = 64
         self.draw_lidar = True
+        self.lidar_style = "Rays"  # Either "Rays", or "Fan" to draw the scan as a filled polygon
+        self.max_drawn_lasers = 360  # Denser scans only draw every n-th laser
+        # The dot drawn at the end of each laser, which is blitted to them all in one call
+        self.end_marker = pygame.Surface((7, 7), pygame.SRCALPHA)
+        pygame.draw.circle(self.end_marker, (0, 0, 255, 255), (3, 3), 3)
 
         # Lidar setup
-        self.sample_rate = 5  # Hz
-        self.lidar_state = 0
+        self.sample_rate = 5  # Hz of simulated time
+        self.lidar_time = 0.0  # Simulated seconds until the next scan is due
         self.sample_count = 32
         self.angle_ref = []
+        self.beam_angles = np.zeros(0)
+        self.beam_directions = np.zeros((0, 2))
+        self.scan_ranges = np.zeros(0)
+        self.scan_angles = np.zeros(0)
         self.new_sample = True
+        self.sample_pose = None  # The (x, y) position the last scan that fell due is taken from
 
         self.initial_laser_length = int(utils.point_distance(self.screen.get_width(), 0,
                                                              self.screen.get_height(), 0))
 
     def setup_lasers(self):
-        """Setup the lasers coming from the robot depending on observation type."""
+        """Setup the lasers coming from the robot depending on observation type.
+
+        The lidar's lasers are evenly spaced around the robot, and are stored as arrays of their
+        angles and unit direction vectors, one row per laser.
+        """
         if self.world.world_type == "Occupancy Grid":
-            self.point_cloud = [[0, 0] for _ in range(self.sample_count)]
-            self.lasers = pygame.sprite.Group()
-            _lidar = pygame.math.Vector2()
-            _lidar.xy = (self.x_pos, self.y_pos)
-            for i in range(self.sample_count):
-                _degree_multiplier = 360 / self.sample_count
-                _cur_angle = int(i * _degree_multiplier)
-                self.angle_ref.append(_cur_angle)
-                _laser = pygame.math.Vector2()
-                _laser.from_polar((self.initial_laser_length, _cur_angle))
-                _laser_sprite = OG_Laser(self.screen, _lidar, _laser)
-                self.lasers.add(_laser_sprite)
-            self.lasers_draw = pygame.sprite.Group()
+            self.beam_angles = np.arange(self.sample_count) * 2 * np.pi / self.sample_count
+            self.beam_directions = np.column_stack((np.cos(self.beam_angles),
+                                                    np.sin(self.beam_angles)))
+            self.point_cloud = np.column_stack((np.zeros(self.sample_count), self.beam_angles))
         elif self.world.world_type == "Landmarks":
             self.point_cloud = [[0, 0]
                                 for _ in range(self.world.landmark_count)]
@@ -189,157 +297,166 @@ class Robot(pygame.sprite.Sprite):
 
     def reset(self):
         """Reset the robots position and sensor data."""
-        self.x_pos = float(self.screen.get_size()[0] / 2)
-        self.y_pos = float(self.screen.get_size()[1] / 2)
+        self.x_pos, self.y_pos = self.world.spawn_point()
         self.angle = 0
         self.rect.center = (self.x_pos, self.y_pos)
         self.hitbox = pygame.Rect(self.x_pos - (self.image_size[0] / 2),
                                   self.y_pos - (self.image_size[1] / 2),
                                   self.image_size[0] + 2,
                                   self.image_size[1] + 2)
+        self.lidar_time = 0.0
         if self.world.world_type == "Occupancy Grid":
-            self.point_cloud = [[0, 0]
-                                for _ in range(self.sample_count)]
+            self.point_cloud = np.column_stack((np.zeros(len(self.beam_angles)), self.beam_angles))
         elif self.world.world_type == "Landmarks":
             self.point_cloud = [[0, 0]
                                 for _ in range(self.world.landmark_count)]
 
-    def update(self):
-        """Updates the position of the robot's rect, hitbox and mask."""
+    def update(self, _dt):
+        """Updates the position of the robot's rect and hitbox, and its sensor.
+
+        Attributes:
+            _dt: The simulated time since the last update in seconds.
+        """
         self.rect.center = (self.x_pos, self.y_pos)
         self.hitbox.center = (self.x_pos, self.y_pos)
-        self.mask = pygame.mask.from_surface(self.image)
         if self.world.world_type == "Occupancy Grid":
-            self.lidar()
+            self.lidar(_dt)
         elif self.world.world_type == "Landmarks":
             self.landmark_sensor()
-        if self.draw_lidar:
-            for _point in self.point_cloud:
-                _coords = [int(_point[0] * np.cos(_point[1]) + self.x_pos),
-                           int(_point[0] * np.sin(_point[1]) + self.y_pos)]
-                pygame.draw.aaline(self.screen,
-                                   (255, 0, 0, 255),
-                                   (self.x_pos, self.y_pos),
-                                   _coords)
-                pygame.draw.circle(self.screen,
-                                   (0, 0, 255, 255),
-                                   _coords, 3)
+
+    def draw(self, _x, _y):
+        """Draw the lidar sensor's lasers if enabled, from the robot drawn at (_x, _y).
+
+        The end-points of all lasers are found at once, and scans with more lasers than
+        self.max_drawn_lasers are thinned out to every n-th laser. In the "Rays" style each laser
+        is drawn once as a plain line, which is far cheaper than anti-aliasing it, and the
+        end-points are all marked with a single blit call. In the "Fan" style the end-points are
+        drawn as one filled polygon instead.
+
+        Returns a list of the rects drawn to the screen.
+        """
+        _dirty_rects = []
+        _point_cloud = np.asarray(self.point_cloud, dtype=np.float64).reshape(-1, 2)
+        if self.draw_lidar and len(_point_cloud) > 1:
+            _step = int(np.ceil(len(_point_cloud) / self.max_drawn_lasers))
+            _point_cloud = _point_cloud[::_step]
+            # The robot's position and the lasers' lengths on the screen
+            _x, _y = self.world.camera.to_screen(_x, _y)
+            _ranges = _point_cloud[:, 0] * self.world.camera.zoom
+            _ends = np.column_stack((_ranges * np.cos(_point_cloud[:, 1]) + _x,
+                                     _ranges * np.sin(_point_cloud[:, 1]) + _y))
+            _ends = _ends.astype(np.int64)
+            _corners = np.vstack((_ends, (_x, _y)))
+            _ends = _ends.tolist()
+            if self.lidar_style == "Fan":
+                _dirty_rects.append(pygame.draw.polygon(self.screen, (255, 200, 200, 255), _ends))
+                _dirty_rects.append(pygame.draw.aalines(self.screen,
+                                                        (255, 0, 0, 255),
+                                                        True,
+                                                        _ends))
+            else:
+                for _end in _ends:
+                    pygame.draw.line(self.screen, (255, 0, 0, 255), (_x, _y), _end)
+                _radius = self.end_marker.get_width() // 2
+                self.screen.blits([(self.end_marker, (_end[0] - _radius, _end[1] - _radius))
+                                   for _end in _ends], False)
+                # One rect covers every ray and marker
+                _left, _top = np.floor(_corners.min(axis=0)).astype(int) - _radius
+                _right, _bottom = np.ceil(_corners.max(axis=0)).astype(int) + _radius + 1
+                _dirty_rects.append(pygame.Rect(_left, _top, _right - _left, _bottom - _top))
+        return _dirty_rects
 
     def toggle_lidar(self):
-        """Toggle whether or not the lidar sensor is visualised."""
-        if self.draw_lidar:
-            self.draw_lidar = False
-        else:
+        """Cycle the lidar sensor's visualisation between rays, a fan and hidden."""
+        if not self.draw_lidar:
             self.draw_lidar = True
+            self.lidar_style = "Rays"
+        elif self.lidar_style == "Rays":
+            self.lidar_style = "Fan"
+        else:
+            self.draw_lidar = False
 
     def rotate(self, _direction):
-        """Rotates the robot around it's centre."""
-        self.image = pygame.transform.rotate(self.og_image, _direction)
+        """Rotates the robot around it's centre.
+
+        The robot turns in fixed steps, so it only ever has a few headings. The rotated image for
+        each heading is cached, in a cache bounded to the most recently used headings, so turning
+        back to a heading doesn't transform the image again.
+        """
+        _heading = _direction % 360
+        if _heading in self.rotations:
+            self.rotations.move_to_end(_heading)
+        else:
+            _image = pygame.transform.rotate(self.og_image, _heading)
+            self.rotations[_heading] = _image
+            if len(self.rotations) > self.rotation_cache_size:
+                self.rotations.popitem(last=False)
+        self.image = self.rotations[_heading]
         self.rect = self.image.get_rect()
         self.rect.center = (self.x_pos, self.y_pos)
 
-    def lidar(self):
-        """Performs all calculations for laser range finding and handles the drawing of lasers.
-
-        This function uses sprites to determine all of the objects each laser around the robot is
-        colliding with, then finds the closest wall. It then finds the closest point on that wall
-        to the robot.
-        """
-        # TODO: Fix flickering on some diagonal lasers
-        # TODO: Make lasers that don't find a result return max length instead of previous result
-        _iterations_per_frame = int(
-            self.sample_count / (30 / self.sample_rate))
-        _slice_from = self.lidar_state * _iterations_per_frame
-        if self.lidar_state == (30 // self.sample_rate) - 2:
-            # Ensure final slice gets the remainder
-            _slice_to = self.sample_count
-        else:
-            _slice_to = _slice_from + _iterations_per_frame
-        # Update the position of each of the laser sprites in self.lasers
-        _lidar = pygame.math.Vector2()
-        _lidar.xy = (self.x_pos, self.y_pos)
-        for _sprite in self.lasers.sprites()[_slice_from:_slice_to]:
-            _sprite.origin = _lidar
-            _sprite.update()
-
-        # Check wall collisions in quadrants
-        _quad_list = [[[0, 90], operator.ge, operator.ge],
-                      [[90, 181], operator.lt, operator.ge],
-                      [[-90, 0], operator.ge, operator.lt],
-                      [[-181, -90], operator.lt, operator.lt]]
-        _collision_list = {}
-        _pixel_buffer = self.world.size * 2
-        for _quad in _quad_list:
-            _quad_lasers = pygame.sprite.Group()
-            _quad_walls = pygame.sprite.Group()
-            for _laser in self.lasers.sprites()[_slice_from:_slice_to]:
-                _cur_angle = int(_laser.angle.as_polar()[1])
-                if _cur_angle >= _quad[0][0] and _cur_angle < _quad[0][1]:
-                    _quad_lasers.add(_laser)
-            for _wall in self.world.wall_list:
-                _cur_pos = _wall.rect.center
-                if _quad[1] == operator.ge:
-                    _x_buf = self.x_pos - _pixel_buffer
-                else:
-                    _x_buf = self.x_pos + _pixel_buffer
-                if _quad[2] == operator.ge:
-                    _y_buf = self.y_pos - _pixel_buffer
-                else:
-                    _y_buf = self.y_pos + _pixel_buffer
-                if _quad[1](_cur_pos[0], _x_buf):
-                    if _quad[2](_cur_pos[1], _y_buf):
-                        _quad_walls.add(_wall)
-            _collision_list.update(pygame.sprite.groupcollide(_quad_lasers,
-                                                              _quad_walls,
-                                                              False,
-                                                              False,
-                                                              pygame.sprite.collide_mask))
-
-        if _collision_list:
-            for _laser in _collision_list:
-                # For each laser, find the closest wall to the robot it is colliding with
-                _closest_wall = None
-                _closest_distance = self.initial_laser_length
-                for _wall in _collision_list[_laser]:
-                    cur_distance = utils.point_distance(self.x_pos,
-                                                        _wall.rect.center[0],
-                                                        self.y_pos,
-                                                        _wall.rect.center[1])
-                    if cur_distance < _closest_distance:
-                        _closest_wall = _wall
-                        _closest_distance = cur_distance
-
-                # Find the closest point on the closest wall to the robot
-                _current_pos = pygame.math.Vector2()
-                _current_pos.update(self.x_pos, self.y_pos)
-                _heading = _laser.angle
-                _direction = _heading.normalize()
-                _closest_point = [self.initial_laser_length,
-                                  self.initial_laser_length]
-                for _ in range(self.initial_laser_length):
-                    _current_pos += _direction
-                    if _closest_wall.rect.collidepoint(_current_pos):
-                        _r = np.sqrt(np.square(self.x_pos - _current_pos.x)
-                                     + np.square(self.y_pos - _current_pos.y))
-                        _theta = np.arctan2(-(self.y_pos - _current_pos.y), -
-                                            (self.x_pos - _current_pos.x))
-                        _closest_point = [_r, _theta]
-                        break
+    def scan(self, _pose, _angles, _directions=None):
+        """Casts every laser from a given pose through the world grid at once.
 
-                # Write resulting point to the point cloud
-                if not _closest_point == [self.initial_laser_length, self.initial_laser_length]:
-                    _cur_angle = (round(_heading.as_polar()[1]) + 450) % 360
-                    try:
-                        self.point_cloud[self.angle_ref.index(
-                            _cur_angle)] = _closest_point
-                    except ValueError:
-                        pass
+        Attributes:
+            _pose: The (x, y) position of the lidar in pixels.
+            _angles: An array of laser directions in radians.
+            _directions: An array of the (x, y) unit vector of each laser, if already computed.
 
-        if self.lidar_state == (30 // self.sample_rate) - 1:
+        Returns:
+            A tuple of (ranges, angles) arrays. Lasers that don't hit a wall return the maximum
+            laser length.
+        """
+        _angles = np.asarray(_angles, dtype=np.float64)
+        _ranges, _, _ = utils.cast_rays(self.world.grid,
+                                        self.world.size,
+                                        _pose[0],
+                                        _pose[1],
+                                        _angles,
+                                        self.initial_laser_length,
+                                        _directions)
+        return _ranges, _angles
+
+    def lidar(self, _dt):
+        """Keeps the lidar's sample timing.
+
+        Once per sample period of simulated time, a scan falls due from the robot's current
+        position, which is recorded as self.sample_pose until the scan is taken by take_scan. At
+        most one scan falls due per update, so sample rates above the simulation's tick rate scan
+        every tick.
+
+        Attributes:
+            _dt: The simulated time since the last update in seconds.
+        """
+        # Allow for rounding error, so a period that is a whole number of ticks stays one
+        if self.lidar_time <= 1e-9:
+            self.sample_pose = (self.x_pos, self.y_pos)
             self.new_sample = True
-            self.lidar_state = 0
-        else:
-            self.lidar_state += 1
+            self.lidar_time = max(self.lidar_time + 1 / self.sample_rate, 0.0)
+        self.lidar_time -= _dt
+
+    def due_scan(self):
+        """Return the position of the scan that has fallen due since this was last called, or
+        None if there isn't one."""
+        if not self.new_sample:
+            return None
+        self.new_sample = False
+        return self.sample_pose
+
+    def take_scan(self, _pose):
+        """Performs all calculations for laser range finding.
+
+        All lasers are cast through the world grid together from a position, to find the exact
+        distance to the first wall along each of their paths. The point cloud entry for each laser
+        is its [range, angle] in polar coordinates, in the same order as self.beam_angles.
+
+        Attributes:
+            _pose: The (x, y) position of the lidar in pixels.
+        """
+        self.scan_ranges, self.scan_angles = self.scan(_pose,
+                                                       self.beam_angles,
+                                                       self.beam_directions)
+        self.point_cloud = np.column_stack((self.scan_ranges, self.scan_angles))
 
     def landmark_sensor(self):
         for _laser in self.lasers:
@@ -371,14 +488,18 @@ class RobotControl():
         self.cur_keys = []
         self.angular_velocity = 6
         self.dummy_screen = pygame.Surface(self.screen.get_size())
-        self.collision_list = []
-        self.recursion_depth = 0
         self.truth_pos = []
+        # Simulation ticks per second of simulated time. Velocities are per tick, so changing
+        # this changes how fast the robot moves in simulated time, not just how often it moves.
+        self.tick_rate = 30
+        # The robot's (x, y) position before the last tick, which drawing interpolates from
+        self.previous_pos = (self.robot.x_pos, self.robot.y_pos)
+        # ((heading, zoom), image) of the robot's image last scaled to the camera's zoom
+        self.scaled_image = (None, None)
 
     def reset(self):
         """Reset the robot's attributes, including position and velocities."""
-        self.robot.x_pos = self.screen.get_size()[0] / 2
-        self.robot.y_pos = self.screen.get_size()[1] / 2
+        self.robot.x_pos, self.robot.y_pos = self.world.spawn_point()
         self.robot.rect.center = (self.robot.x_pos, self.robot.y_pos)
         self.velocity = [0, 0, 0]
         self.odo_velocity = self.velocity
@@ -388,40 +509,63 @@ class RobotControl():
         self.update()
 
     def update(self):
-        """Update all aspects of the robot, including velocities, position and lidar sensor."""
+        """Advance the robot by one simulation tick, updating its velocities, position and lidar
+        sensor."""
+        self.previous_pos = (self.robot.x_pos, self.robot.y_pos)
         self.move_velocity()
         self.robot.rotate(self.robot.angle)
-        self.robot.update()
-        self.screen.blit(self.robot.image, self.robot.rect)
+        self.robot.update(1 / self.tick_rate)
+
+    def interpolated_pos(self, _alpha):
+        """Return the robot's (x, y) position a fraction _alpha of the way from its position
+        before the last tick to its current position."""
+        return (self.previous_pos[0] + (self.robot.x_pos - self.previous_pos[0]) * _alpha,
+                self.previous_pos[1] + (self.robot.y_pos - self.previous_pos[1]) * _alpha)
+
+    def draw(self, _alpha=1.0):
+        """Draw the robot and its lidar sensor.
+
+        The robot is drawn between its last two simulated positions, so its movement stays smooth
+        when frames aren't drawn in step with simulation ticks. Its heading isn't interpolated, as
+        it only turns between a few cached headings. The image scaled to the camera's zoom is kept
+        until the robot turns or the zoom changes, rather than being scaled again every frame.
+
+        Attributes:
+            _alpha: How far through the current tick the frame is drawn, from 0 to 1.
+
+        Returns a list of the rects drawn to the screen.
+        """
+        _x, _y = self.interpolated_pos(_alpha)
+        _dirty_rects = self.robot.draw(_x, _y)
+        _camera = self.world.camera
+        _image = self.robot.image
+        if _camera.zoom != 1:
+            _key = (self.robot.angle % 360, _camera.zoom)
+            if self.scaled_image[0] != _key:
+                _size = (round(_image.get_width() * _camera.zoom),
+                         round(_image.get_height() * _camera.zoom))
+                self.scaled_image = (_key, pygame.transform.scale(_image, _size))
+            _image = self.scaled_image[1]
+        _rect = _image.get_rect()
+        _rect.center = _camera.to_screen(_x, _y)
+        _dirty_rects.append(self.screen.blit(_image, _rect))
+        return _dirty_rects
 
     def move_velocity(self):
         """Controls the robot's position.
 
-        This function takes in the Robot.velocity vector. The collision method returns, what side,
-        if any, of the robot is colliding. It then sets the velocity in that direction to zero so
-        the robot will maintain it's velocity in the perpendicular axis, but stops moving towards
-        the collision. Then update the robot's position. If the robot isn't receiving input to move
-        forward, decelerate velocities.
-        """
-        # Check if a collision has occurred, and zero the velocity axis associated with it.
-        _collision_side = self.collision_detector()
-        self.collision_list.append(_collision_side)
-        if len(self.collision_list) > 3:
-            self.collision_list.pop(0)
-        if not _collision_side:
-            self.collision_list = []
-        if "TOP" in self.collision_list:
-            if self.velocity[1] < 0:
-                self.velocity[1] = 0
-        if "BOTTOM" in self.collision_list:
-            if self.velocity[1] > 0:
-                self.velocity[1] = 0
-        if "RIGHT" in self.collision_list:
-            if self.velocity[0] > 0:
-                self.velocity[0] = 0
-        if "LEFT" in self.collision_list:
-            if self.velocity[0] < 0:
-                self.velocity[0] = 0
+        This function takes in the Robot.velocity vector. The collision method returns the
+        contact normal of every wall the robot is touching. The part of the velocity heading into
+        each wall is then removed so the robot will maintain it's velocity along the wall, but
+        stops moving towards the collision. Then update the robot's position. If the robot isn't
+        receiving input to move forward, decelerate velocities.
+        """
+        # Check if a collision has occurred, and remove the velocity towards each wall touched.
+        for _normal_x, _normal_y in self.collision_detector():
+            _into = self.velocity[0] * _normal_x + self.velocity[1] * _normal_y
+            if _into < 0:
+                self.velocity[0] = float(self.velocity[0] - _into * _normal_x)
+                self.velocity[1] = float(self.velocity[1] - _into * _normal_y)
 
         # Update robot position according to the velocity vector.
         self.robot.x_pos += self.velocity[0]
@@ -526,129 +670,43 @@ class RobotControl():
         return self.cur_keys
 
     def collision_detector(self):
-        """Finds if the robot is colliding and the associated side.
-
-        This function uses sprites to determine all of the objects the robot is colliding with,
-        then finds the closest wall to determine which side of the robot is colliding. To solve for
-        cases where the robot is colliding with two walls simultaneously, the function utilises
-        recursion to find the second closest wall.
-        """
-        _collision_list = pygame.sprite.spritecollide(self.robot,
-                                                      self.world.wall_list,
-                                                      False,
-                                                      pygame.sprite.collide_mask)
-        if len(_collision_list) > 0:
-            # Find the closest colliding wall
-            _closest_distance = self.robot.initial_laser_length
-            _closest_wall = None
-            for _wall in _collision_list:
-                cur_distance = utils.point_distance(self.robot.x_pos,
-                                                    _wall.rect.center[0],
-                                                    self.robot.y_pos,
-                                                    _wall.rect.center[1])
-                if cur_distance < _closest_distance:
-                    s_closest_wall = _closest_wall
-                    _closest_wall = _wall
-                    _closest_distance = cur_distance
-            # If performing recursion, find the second closest wall
-            if self.recursion_depth > 0 and not s_closest_wall is None:
-                _closest_wall = s_closest_wall
-            _wall = _closest_wall
-
-            # Find which side of the robot is closest to the closest wall
-            _sides = [self.robot.hitbox.midtop, self.robot.hitbox.midright,
-                      self.robot.hitbox.midbottom, self.robot.hitbox.midleft]
-            _closest_side = -1
-            _closest_side_distance = self.robot.initial_laser_length
-            for _i, _side in enumerate(_sides):
-                distance = utils.point_distance(_side[0],
-                                                _wall.rect.center[0],
-                                                _side[1],
-                                                _wall.rect.center[1])
-                if distance < _closest_side_distance:
-                    _closest_side_distance = distance
-                    _closest_side = _i
-            _to_return = None
-            if _closest_side == 0:
-                _to_return = "TOP"
-            if _closest_side == 1:
-                _to_return = "RIGHT"
-            if _closest_side == 2:
-                _to_return = "BOTTOM"
-            if _closest_side == 3:
-                _to_return = "LEFT"
-
-            # If the robot is already colliding with a wall, collide the second closest wall
-            if len(self.collision_list) > 0:
-                if _to_return == self.collision_list[len(self.collision_list) - 1]:
-                    if self.recursion_depth <= 1:
-                        self.recursion_depth += 1
-                        return self.collision_detector()
-            self.recursion_depth = 0
-            return _to_return
-        return None
-
-
-class OG_Laser(pygame.sprite.Sprite):
-    """Sprite for the lidar sensor's laser beams.
+        """Finds the walls the robot is colliding with and the contact normal of each.
 
-    Handles the attributes of each laser. Uses invisible surfaces to calculate positional offsets
-    for each laser depending on its given rotation. Also contains the laser's collision mask. It
-    also handles the positional updates sent from RobotControl.
+        The world grid is used as a spatial index of the walls: the robot is treated as a circle
+        and only the cells under its hitbox are tested, so the cost doesn't depend on how many
+        walls the map contains. Each occupied cell is a square, and the robot touches it if the
+        closest point of the square to the robot's centre is within the robot's radius.
 
-    Attributes:
-        _p_screen: The main pygame screen surface.
-        _origin: A pygame.math.Vector2() object that is the robot's base position.
-        _angle: A pygame.math.Vector2() object that contains polar coordinates stating the laser's
-            length and direction _angle.
-    """
-
-    def __init__(self, _p_screen, _origin, _angle):
-        pygame.sprite.Sprite.__init__(self)
-
-        # Use a "dummy" surface to determine the width and height of the rotated laser rect
-        _dummy_screen = pygame.Surface(
-            (_p_screen.get_height() * 2, _p_screen.get_width() * 2),
-            pygame.SRCALPHA)
-        _dummy_rect = pygame.draw.line(_dummy_screen,
-                                       (0, 255, 0, 255),
-                                       _origin + _origin,
-                                       _origin + _origin + _angle)
-
-        self.origin = _origin
-        self.angle = _angle
-        _int_angle = int(_angle.as_polar()[1])
-        # Find an offset for the laser's draw position depending on its angle
-        if 0 <= _int_angle <= 90:
-            self.x_offset = 0
-            self.y_offset = 0
-        elif _int_angle > 90:
-            self.x_offset = -_dummy_rect.width
-            self.y_offset = 0
-        elif _int_angle < -90:
-            self.x_offset = -_dummy_rect.width
-            self.y_offset = -_dummy_rect.height
-        elif -90 <= _int_angle < 0:
-            self.x_offset = 0
-            self.y_offset = -_dummy_rect.height
-
-        self.screen = _p_screen
-        self.image = pygame.Surface((_dummy_rect.width, _dummy_rect.height),
-                                    pygame.SRCALPHA)
-        self.new_start = (self.origin.x + self.x_offset,
-                          self.origin.y + self.y_offset)
-        self.rect = pygame.draw.aaline(self.image,
-                                       (255, 0, 0, 255),
-                                       (-self.x_offset, - self.y_offset),
-                                       (int(_angle.x - self.x_offset),
-                                        int(_angle.y - self.y_offset)))
-        self.mask = pygame.mask.from_surface(self.image, 50)
-
-    def update(self):
-        """Update the laser's position."""
-        self.new_start = (self.origin.x + self.x_offset,
-                          self.origin.y + self.y_offset)
-        self.rect.topleft = self.new_start
+        Returns:
+            An array of unit (x, y) contact normals, pointing from each wall touched towards the
+            robot's centre, one row per wall cell.
+        """
+        _radius = self.robot.robot_size / 2
+        _size = self.world.size
+        _grid = self.world.grid
+        _x = self.robot.x_pos
+        _y = self.robot.y_pos
+        _top = max(int((_y - _radius) // _size), 0)
+        _left = max(int((_x - _radius) // _size), 0)
+        _bottom = min(int((_y + _radius) // _size) + 1, _grid.shape[0])
+        _right = min(int((_x + _radius) // _size) + 1, _grid.shape[1])
+        if _top >= _bottom or _left >= _right:
+            return np.zeros((0, 2))
+        _rows, _cols = np.nonzero(_grid[_top:_bottom, _left:_right])
+        _rows = _rows + _top
+        _cols = _cols + _left
+
+        # The closest point of each cell to the robot's centre, and the offset from it
+        _dx = _x - np.clip(_x, _cols * _size, (_cols + 1) * _size)
+        _dy = _y - np.clip(_y, _rows * _size, (_rows + 1) * _size)
+        # If the centre is inside a cell, push it away from the cell's centre instead
+        _inside = (_dx == 0) & (_dy == 0)
+        _dx = np.where(_inside, _x - (_cols + 0.5) * _size, _dx)
+        _dy = np.where(_inside, _y - (_rows + 0.5) * _size, _dy)
+        _distance = np.hypot(_dx, _dy)
+        _touching = (_distance < _radius) | _inside
+        _distance = np.maximum(_distance[_touching], 1e-9)
+        return np.column_stack((_dx[_touching] / _distance, _dy[_touching] / _distance))
 
 
 class LM_Laser():
@@ -682,7 +740,7 @@ class Wall(pygame.sprite.Sprite):
     """Sprite for the lidar sensor's laser beams.
 
     Handles the attributes of each laser. Uses invisible surfaces to calculate positional offsets
-    for each laser depending on its given rotation. Also contains the laser's collision mask.
+    for each laser depending on its given rotation.
 
     Attributes:
         _top: The desired pixel for the top of the wall.
@@ -697,9 +755,6 @@ class Wall(pygame.sprite.Sprite):
         self.color = (0, 0, 0, 255)
         self.image = pygame.Surface((_width, _height), pygame.SRCALPHA)
         self.image.fill(self.color)
-        self.mask = pygame.mask.from_threshold(self.image,
-                                               pygame.Color('black'),
-                                               (1, 1, 1, 255))
 
     def update(self, _color):
         """Update the wall's colour.
@@ -709,6 +764,104 @@ class Wall(pygame.sprite.Sprite):
         self.image.fill(_color)
 
 
+class Camera():
+    """The viewport onto the world that is drawn on the screen.
+
+    Positions in the world are in pixels from the top left of the world map, which can be larger
+    than the screen. The camera is the world position at the top left of the screen and a zoom,
+    the number of screen pixels per world pixel. It follows the robot without showing past the
+    edges of the world.
+
+    Attributes:
+        _screen_size: The (width, height) of the screen in pixels.
+    """
+
+    def __init__(self, _screen_size):
+        self.width, self.height = _screen_size
+        self.x = 0
+        self.y = 0
+        self.zoom = 1.0
+        self.min_zoom = 1 / 32
+        self.max_zoom = 4.0
+        self.moved = True  # Whether the camera has moved since it was last checked
+
+    def view_width(self):
+        """Return the width of the world in view in world pixels."""
+        return self.width / self.zoom
+
+    def view_height(self):
+        """Return the height of the world in view in world pixels."""
+        return self.height / self.zoom
+
+    def set_zoom(self, _zoom):
+        """Set the zoom, within the camera's limits."""
+        _zoom = min(max(_zoom, self.min_zoom), self.max_zoom)
+        if _zoom != self.zoom:
+            self.zoom = _zoom
+            self.moved = True
+
+    def follow(self, _x, _y, _world_width, _world_height):
+        """Centre the camera on a world position, keeping it inside a world of the given size."""
+        _x = int(min(max(_x - self.view_width() / 2, 0), max(_world_width - self.view_width(), 0)))
+        _y = int(min(max(_y - self.view_height() / 2, 0),
+                     max(_world_height - self.view_height(), 0)))
+        if (_x, _y) != (self.x, self.y):
+            self.x = _x
+            self.y = _y
+            self.moved = True
+
+    def to_screen(self, _x, _y):
+        """Convert world positions, or arrays of them, to screen positions."""
+        return (_x - self.x) * self.zoom, (_y - self.y) * self.zoom
+
+    def to_world(self, _x, _y):
+        """Convert screen positions, or arrays of them, to world positions."""
+        return _x / self.zoom + self.x, _y / self.zoom + self.y
+
+    def screen_rect(self, _left, _top, _right, _bottom):
+        """Return the screen rect of a rectangle in the world.
+
+        Each edge is rounded to a whole pixel on its own, so that rectangles which meet in the
+        world also meet on the screen.
+        """
+        _left, _top = self.to_screen(_left, _top)
+        _right, _bottom = self.to_screen(_right, _bottom)
+        return pygame.Rect(round(_left), round(_top),
+                           round(_right) - round(_left), round(_bottom) - round(_top))
+
+    def level(self, _cell_size, _levels, _min_pixels):
+        """Return the level of detail to draw a grid of cells at.
+
+        Level n pools each 2^n by 2^n block of cells into one, and the level chosen is the finest
+        one whose cells are at least _min_pixels wide on the screen. Drawing cells a few pixels
+        wide, rather than one, keeps the tiles they are drawn in large enough to draw efficiently.
+
+        Attributes:
+            _cell_size: The width of the grid's cells in world pixels.
+            _levels: The number of levels available.
+            _min_pixels: The smallest width of a cell on the screen in pixels.
+        """
+        _cell_pixels = _cell_size * self.zoom
+        _level = 0
+        if _cell_pixels < _min_pixels:
+            _level = int(np.ceil(np.log2(_min_pixels / _cell_pixels)))
+        return min(_level, _levels - 1)
+
+    def visible_tiles(self, _tile_pixels, _tile_rows, _tile_cols):
+        """Return the (row, column) of every tile of a tiled layer that is on the screen.
+
+        Attributes:
+            _tile_pixels: The width of each square tile in world pixels.
+            _tile_rows: The number of rows of tiles in the layer.
+            _tile_cols: The number of columns of tiles in the layer.
+        """
+        _top = max(int(self.y // _tile_pixels), 0)
+        _left = max(int(self.x // _tile_pixels), 0)
+        _bottom = min(int(np.ceil((self.y + self.view_height()) / _tile_pixels)), _tile_rows)
+        _right = min(int(np.ceil((self.x + self.view_width()) / _tile_pixels)), _tile_cols)
+        return [(_row, _col) for _row in range(_top, _bottom) for _col in range(_left, _right)]
+
+
 class World():
     """Writes and draws the world map.
 
@@ -721,73 +874,235 @@ class World():
     def __init__(self, _p_screen):
         self.screen = _p_screen
         self.size = 20
-        self.grid = [[0 for _ in range(self.screen.get_size()[0] // self.size)]
-                     for __ in range(self.screen.get_size()[1] // self.size)]
+        self.metres_per_pixel = 0.01  # The real world scale, used for maps in ROS format
+        self.grid = np.zeros((self.screen.get_size()[1] // self.size,
+                              self.screen.get_size()[0] // self.size), dtype=np.uint8)
         self.wall_list = pygame.sprite.Group()
+        self.camera = Camera(self.screen.get_size())
+        # The world map is drawn in square tiles of cells, cached until the cells in them change.
+        # When zoomed out, each tile pools the cells of a larger area of the world.
+        self.tile_size = 32
+        self.levels = 8
+        self.tiles = {}
+        self.tiles_zoom = None  # The zoom the cached tiles were drawn at
+        self.tiles_level = 0  # The level of detail the cached tiles were drawn at
         self.world_type = "Occupancy Grid"
         self.landmark_count = 10
+        self.random = random.Random()  # Seedable source of random landmark positions
+        self.shared_grid = None  # The SharedGrid the grid is kept in, if it has been shared
 
     def write_map(self, _robot_size):
         """Draws the world map into an array of 1s and 0s."""
-        if self.world_type == "Occupancy Grid":
-            for i, _ in enumerate(self.grid):
-                for j, __ in enumerate(self.grid[0]):
-                    if i == 0 or i == len(self.grid) - 1 or j == 0 or j == len(self.grid[0]) - 1:
-                        self.grid[i][j] = 1
-                    else:
-                        self.grid[i][j] = 0
-                    if 20 < i < 30:
-                        if 20 < j < 30:
+        self.tiles = {}
+        with self.editing():
+            if self.world_type == "Occupancy Grid":
+                for i, _ in enumerate(self.grid):
+                    for j, __ in enumerate(self.grid[0]):
+                        if (i == 0 or i == len(self.grid) - 1
+                                or j == 0 or j == len(self.grid[0]) - 1):
                             self.grid[i][j] = 1
-        elif self.world_type == "Landmarks":
-            _landmark_list = []
-            for i in range(self.landmark_count):
-                _r_point = [random.randrange(0, len(self.grid)),
-                            random.randrange(0, len(self.grid[0]))]
-                _hor_cen = self.screen.get_width() / 2
-                _vert_cen = self.screen.get_height() / 2
-                _return = np.array([_r_point[1] * self.size > _hor_cen - _robot_size / 2,
-                                    _r_point[1] * self.size < _hor_cen +
-                                    _robot_size / 2,
-                                    _r_point[0] * self.size < _vert_cen +
-                                    _robot_size / 2,
-                                    _r_point[0] * self.size > _vert_cen - _robot_size / 2])
-                if not _return.all():
-                    _landmark_list.append(_r_point)
-            for _point in _landmark_list:
-                self.grid[_point[0]][_point[1]] = 1
+                        else:
+                            self.grid[i][j] = 0
+                        if 20 < i < 30:
+                            if 20 < j < 30:
+                                self.grid[i][j] = 1
+            elif self.world_type == "Landmarks":
+                _landmark_list = []
+                for i in range(self.landmark_count):
+                    _r_point = [self.random.randrange(0, len(self.grid)),
+                                self.random.randrange(0, len(self.grid[0]))]
+                    _hor_cen, _vert_cen = self.spawn_point()
+                    _return = np.array([_r_point[1] * self.size > _hor_cen - _robot_size / 2,
+                                        _r_point[1] * self.size < _hor_cen +
+                                        _robot_size / 2,
+                                        _r_point[0] * self.size < _vert_cen +
+                                        _robot_size / 2,
+                                        _r_point[0] * self.size > _vert_cen - _robot_size / 2])
+                    if not _return.all():
+                        _landmark_list.append(_r_point)
+                for _point in _landmark_list:
+                    self.grid[_point[0]][_point[1]] = 1
 
     def create_sprites(self):
-        """Add sprites in the positions indicated by the self.grid array to a sprite group."""
+        """Add a sprite for every wall in the grid to a sprite group, for the landmark sensor.
+
+        Only landmark worlds use the sprites, so occupancy grid worlds, which may be very large,
+        have none.
+        """
         self.wall_list.empty()
-        for i in range(len(self.grid)):
-            for j in range(len(self.grid[0])):
-                if self.grid[i][j]:
-                    wall_rect = Wall(j * self.size,
-                                     i * self.size,
-                                     self.size,
-                                     self.size)
-                    self.wall_list.add(wall_rect)
+        if self.world_type == "Landmarks":
+            for _row, _col in zip(*np.nonzero(self.grid)):
+                self.wall_list.add(Wall(int(_col) * self.size,
+                                        int(_row) * self.size,
+                                        self.size,
+                                        self.size))
+        self.tiles = {}
 
     def clear_map(self):
-        self.grid = [[0 for _ in range(self.screen.get_size()[0] // self.size)]
-                     for __ in range(self.screen.get_size()[1] // self.size)]
+        """Erase every wall, keeping the world's size."""
+        self.set_grid(np.zeros(self.grid.shape, dtype=np.uint8))
+
+    def save_map(self, _path):
+        """Save the world grid and its cell size to a bit-packed grid file."""
+        map_io.save_grid(_path, self.grid, self.size)
+
+    def load_map(self, _path):
+        """Load the world grid and its cell size from a bit-packed grid file."""
+        _grid, self.size = map_io.load_grid(_path)
+        self.set_grid(_grid)
+
+    def load_ros_map(self, _yaml_path):
+        """Load the world grid from a ROS map_server map, resampled to the world's cell size."""
+        self.set_grid(map_io.load_ros_map(_yaml_path, self.size * self.metres_per_pixel))
+
+    def open_map(self, _path):
+        """Load the world grid from the YAML file of a ROS map_server map, or else a grid file."""
+        if _path.endswith((".yaml", ".yml")):
+            self.load_ros_map(_path)
+        else:
+            self.load_map(_path)
 
-    def write_to_map(self, _mode, _x, _y):
-        if _mode:
-            self.grid[_y][_x] = 1
+    def set_grid(self, _grid):
+        """Replace the world grid, keeping it in shared memory if it has been shared."""
+        self.tiles = {}
+        if self.shared_grid is None:
+            self.grid = _grid
         else:
-            self.grid[_y][_x] = 0
+            self.share_grid(self.shared_grid.name, _grid)
+
+    def share_grid(self, _name=None, _grid=None):
+        """Move the world grid into a SharedGrid, so other processes can read it without copying.
+
+        The grid is written to in place from then on. A grid of a different shape is moved to a
+        new shared memory block of the same name, which readers have to attach to again.
+
+        Attributes:
+            _name: The name of the shared memory block, or None for a unique name.
+            _grid: The grid to share, which defaults to the current grid.
+
+        Returns:
+            The SharedGrid.
+        """
+        _grid = np.asarray(self.grid if _grid is None else _grid, dtype=np.uint8)
+        if self.shared_grid is None or self.shared_grid.array.shape != _grid.shape:
+            if self.shared_grid is not None:
+                # The old block's cells have to be released before it can be closed
+                self.grid = _grid
+                self.shared_grid.close()
+            self.shared_grid = SharedGrid(_name, _grid.shape, np.uint8)
+        if _grid is not self.shared_grid.array:
+            with self.shared_grid.writing() as _cells:
+                _cells[:, :] = _grid
+        self.grid = self.shared_grid.array
+        return self.shared_grid
+
+    def unshare_grid(self):
+        """Move the world grid out of shared memory, freeing its block."""
+        if self.shared_grid is not None:
+            self.grid = self.grid.copy()
+            self.shared_grid.close()
+            self.shared_grid = None
+
+    def editing(self):
+        """Return a context to write to the grid in, which marks the shared grid as being written
+        to if there is one."""
+        if self.shared_grid is None:
+            return contextlib.nullcontext()
+        return self.shared_grid.writing()
+
+    def width(self):
+        """Return the width of the world in pixels."""
+        return self.grid.shape[1] * self.size
+
+    def height(self):
+        """Return the height of the world in pixels."""
+        return self.grid.shape[0] * self.size
+
+    def spawn_point(self):
+        """Return the (x, y) position in pixels the robot starts from, the centre of the world."""
+        return float(self.width() / 2), float(self.height() / 2)
+
+    def follow(self, _x, _y):
+        """Move the camera to follow a world position."""
+        self.camera.follow(_x, _y, self.width(), self.height())
+
+    def write_to_map(self, _mode, _x, _y):
+        """Write walls to, or erase walls from, the grid at a cell or arrays of cells."""
+        _tile_cells = self.tile_size * 2 ** self.tiles_level
+        for _tile in zip((np.atleast_1d(_y) // _tile_cells).tolist(),
+                         (np.atleast_1d(_x) // _tile_cells).tolist()):
+            self.tiles.pop(_tile, None)
+        with self.editing():
+            if _mode:
+                self.grid[_y, _x] = 1
+            else:
+                self.grid[_y, _x] = 0
+
+    def render_tile(self, _tile_row, _tile_col, _level, _size):
+        """Draw one tile of the world map, background and walls, onto a surface.
+
+        The tile's cells are pooled to the level of detail, keeping a wall wherever any of the
+        pooled cells are walls, and converted to an image with one pixel per pooled cell in a
+        single operation. The image is then scaled to the tile's size on the screen.
+
+        Attributes:
+            _tile_row: The row of the tile at the level of detail.
+            _tile_col: The column of the tile at the level of detail.
+            _level: The level of detail, where each pixel of the tile's image pools 2^level by
+                2^level cells.
+            _size: The (width, height) of the tile on the screen.
+        """
+        _tile_cells = self.tile_size * 2 ** _level
+        _row = _tile_row * _tile_cells
+        _col = _tile_col * _tile_cells
+        _cells = utils.pool(self.grid[_row:_row + _tile_cells, _col:_col + _tile_cells] != 0,
+                            2 ** _level,
+                            np.max,
+                            False)
+        _colours = np.array([[255, 255, 255], [0, 0, 0]], dtype=np.uint8)
+        _image = pygame.surfarray.make_surface(_colours[_cells.T.astype(np.uint8)])
+        return pygame.transform.scale(_image, _size)
 
     def draw(self):
-        """Draw the world map."""
-        self.wall_list.draw(self.screen)
+        """Draw the part of the world map in the camera's view.
+
+        Only the tiles on the screen are drawn, each from the cache if it hasn't changed. Tiles
+        that have left the screen are dropped from the cache, and when zoomed out the tiles are
+        drawn at a level of detail that matches the screen's pixels, so the cost of drawing
+        doesn't grow with the size of the world.
+        """
+        self.screen.fill((255, 255, 255))
+        if self.camera.zoom != self.tiles_zoom:
+            self.tiles = {}
+            self.tiles_zoom = self.camera.zoom
+            self.tiles_level = self.camera.level(self.size, self.levels, 2)
+        _tile_cells = self.tile_size * 2 ** self.tiles_level
+        _tile_pixels = _tile_cells * self.size
+        _tiles = {}
+        for _tile in self.camera.visible_tiles(_tile_pixels,
+                                               -(-self.grid.shape[0] // _tile_cells),
+                                               -(-self.grid.shape[1] // _tile_cells)):
+            _rect = self.camera.screen_rect(
+                _tile[1] * _tile_pixels,
+                _tile[0] * _tile_pixels,
+                min((_tile[1] + 1) * _tile_pixels, self.width()),
+                min((_tile[0] + 1) * _tile_pixels, self.height()))
+            _tiles[_tile] = self.tiles.get(_tile)
+            # Rounding to whole pixels can change a tile's size by a pixel as the camera moves
+            if _tiles[_tile] is None or _tiles[_tile].get_size() != _rect.size:
+                _tiles[_tile] = self.render_tile(*_tile, self.tiles_level, _rect.size)
+            self.screen.blit(_tiles[_tile], _rect)
+        self.tiles = _tiles
 
 
 class SLAM():
     """Contains all aspects of the SLAM algorithm (WIP).
 
     Handles calculations and drawing of the occupancy grid map. Creates fake odometry positioning.
+    With the "Particle Filter" SLAM type, the position the map is built from is estimated by a
+    particle filter driven by the odometry, instead of being the odometry position itself. With
+    the "Scan Matcher" SLAM type, the odometry's movement is corrected by matching each scan to
+    the map before it is added.
 
     Attributes:
         _p_screen: The main pygame screen surface.
@@ -800,72 +1115,395 @@ class SLAM():
 
         # Occupancy Grid Setup
         self.grid_size = 11
-        self.grid = [[0.5 for _ in range(self.screen.get_size()[0] // self.grid_size)]
-                     for __ in range(self.screen.get_size()[1] // self.grid_size)]
+        # Inverse sensor model: the probability a cell is occupied given that a laser ended in it
+        # (hit) or passed through it (miss), and the bounds the cell probabilities are clamped to
+        self.p_hit = 0.7
+        self.p_miss = 0.4
+        self.p_min = 0.03
+        self.p_max = 0.97
+        self.p_occupied = 0.6  # The probability above which a cell is treated as an obstacle
+        self.grid = self.new_grid()  # Occupancy stored in log-odds form
+        self.likelihood_field = LikelihoodField(self.grid.shape, self.grid_size)
         self.show_occupancy_grid = False
+        self.grid_alpha = 255  # Opacity of the occupancy grid when drawn over the world
+        # Coarser levels of detail of the grid, where level n pools each 2^n by 2^n block of cells
+        # into the mean and the maximum of their probabilities. Level 0 is the grid itself.
+        self.levels = 5
+        self.pyramid_mean, self.pyramid_max = self.new_pyramid()
+        self.tile_surfaces = {}  # The tiles of the grid on the screen, drawn onto surfaces
+        self.tiles_zoom = None  # The zoom the cached tiles were drawn at
+        # The grid is redrawn in square tiles of cells, only when cells in a tile have changed
+        self.tile_size = 16
+        self.dirty_tiles = self.new_dirty_tiles()
 
         # Odometry Setup
         self.odo_x = self.robot.robot.x_pos
         self.odo_y = self.robot.robot.y_pos
         self.odo_error = 0.2
         self.odo_pos = []
+        self.rng = np.random.default_rng()  # Seedable source of odometry noise
+
+        # Particle Filter Setup
+        self.slam_type = "Occupancy Grid"
+        # The particle filter has its own generator, so sampling particles doesn't change the
+        # odometry noise of a seed
+        self.particle_filter = ParticleFilter(self.odo_x, self.odo_y)
+        self.estimate_pos = []
+
+        # Scan Matcher Setup
+        self.scan_matcher = ScanMatcher()
+        self.match_x = self.odo_x
+        self.match_y = self.odo_y
+        self.match_heading = 0.0  # Correction to the lidar's heading in radians
+
+        # Background mapping: the worker thread running SLAM, if there is one, and the lock held
+        # while the grid, its levels of detail and the dirty tiles are written or drawn
+        self.worker = None
+        self.lock = threading.Lock()
+        # A copy of the grid in shared memory that other processes can read, if it is shared
+        self.shared_grid = None
+        self.recorder = None  # The Recorder every tick is logged to, if recording
 
     def reset(self):
-        """Reset the SLAM state."""
-        self.grid = [[0.5 for _ in range(self.screen.get_size()[0] // self.grid_size)]
-                     for __ in range(self.screen.get_size()[1] // self.grid_size)]
+        """Reset the SLAM state, discarding any ticks the mapping worker hasn't run yet."""
+        if self.worker is not None:
+            self.worker.clear()
+        if self.shared_grid is not None:
+            # Clear the shared grid in place, so processes reading it can carry on reading it
+            _top, _left, _bottom, _right = self.grid.bounds()
+            with self.shared_grid.writing() as _cells:
+                _cells[_top:_bottom, _left:_right] = 0
+        self.grid = self.new_grid()
+        self.likelihood_field = LikelihoodField(self.grid.shape, self.grid_size)
+        self.pyramid_mean, self.pyramid_max = self.new_pyramid()
+        self.dirty_tiles = self.new_dirty_tiles()
         self.odo_x = self.robot.robot.x_pos
         self.odo_y = self.robot.robot.y_pos
         self.odo_pos = []
+        self.particle_filter.reset(self.odo_x, self.odo_y)
+        self.estimate_pos = []
+        self.match_x = self.odo_x
+        self.match_y = self.odo_y
+        self.match_heading = 0.0
+        if self.shared_grid is not None and self.shared_grid.array.shape != self.grid.shape:
+            self.share_grid(self.shared_grid.name)
+
+    def seed(self, _seed):
+        """Seed the odometry noise and particle filter so that their results are repeatable.
+
+        The particle filter is given a generator spawned from the seed, independent of the
+        odometry noise's, so a seed gives the same odometry whichever SLAM type is run.
+        """
+        self.rng = np.random.default_rng(_seed)
+        self.particle_filter.rng = np.random.default_rng(np.random.SeedSequence(_seed).spawn(1)[0])
+        self.particle_filter.reset(self.odo_x, self.odo_y)
+
+    def start_worker(self):
+        """Start running SLAM on a background MappingWorker, if it isn't already."""
+        if self.worker is None:
+            self.worker = MappingWorker(self)
+
+    def stop_worker(self):
+        """Stop the background MappingWorker, after it has run every tick given to it, raising an
+        error if SLAM failed on it."""
+        _worker, self.worker = self.worker, None
+        if _worker is not None:
+            _worker.stop()
+
+    def share_grid(self, _name=None):
+        """Keep a copy of the occupancy grid in a SharedGrid, which other processes can read
+        without copying while it is mapped.
+
+        The grid itself stays in chunks, and the shared grid is a full size array of the same
+        log-odds, updated with every cell that changes. On most systems, the pages of a shared
+        memory block that are never written to take no memory, so unexplored space is still
+        almost free. A grid of a different shape, after a reset, is moved to a new block of the
+        same name, which readers have to attach to again.
+
+        Attributes:
+            _name: The name of the shared memory block, or None for a unique name.
+
+        Returns:
+            The SharedGrid.
+        """
+        with self.lock:
+            if self.shared_grid is not None:
+                self.shared_grid.close()
+            self.shared_grid = SharedGrid(_name, self.grid.shape, self.grid.dtype)
+            _top, _left, _bottom, _right = self.grid.bounds()
+            with self.shared_grid.writing() as _cells:
+                _cells[_top:_bottom, _left:_right] = self.grid[_top:_bottom, _left:_right]
+        return self.shared_grid
+
+    def unshare_grid(self):
+        """Stop keeping a copy of the occupancy grid in shared memory, and free its block."""
+        with self.lock:
+            if self.shared_grid is not None:
+                self.shared_grid.close()
+                self.shared_grid = None
+
+    def start_recording(self, _path, _compress=False):
+        """Record every tick's scan and poses from now on to a log file, with a Recorder."""
+        self.stop_recording()
+        self.recorder = Recorder(_path, self.robot.robot.beam_angles, _compress)
+
+    def stop_recording(self):
+        """Stop recording, writing the remaining records to the log file."""
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def tick(self, _velocity, _scan_pose=None, _truth_pose=None):
+        """Run SLAM for one simulation tick, and record it if recording.
+
+        Attributes:
+            _velocity: The robot's true (x, y) movement this tick, which odometry adds noise to.
+            _scan_pose: The (x, y) position of the scan that fell due this tick, if any, which is
+                taken and added to the map.
+            _truth_pose: The robot's true (x, y) position, which is only used for recording.
+        """
+        self.odometry(_velocity)
+        if _scan_pose is not None:
+            self.robot.robot.take_scan(_scan_pose)
+            self.occupancy_grid()
+        if self.recorder is not None:
+            self.recorder.record(_truth_pose,
+                                 (self.odo_x, self.odo_y),
+                                 self.pose(),
+                                 _velocity,
+                                 _scan_pose,
+                                 self.robot.robot.scan_ranges if _scan_pose is not None else None)
+
+    def pose(self):
+        """Return the best estimate of the robot's position that the map is built from."""
+        if self.slam_type == "Particle Filter":
+            _estimate = self.particle_filter.estimate()
+            return float(_estimate[0]), float(_estimate[1])
+        if self.slam_type == "Scan Matcher":
+            return self.match_x, self.match_y
+        return self.odo_x, self.odo_y
+
+    def new_grid(self):
+        """Return an occupancy grid covering the world where every cell is unknown (log-odds of 0).
+
+        The grid is stored in chunks that are only allocated once a laser has reached them, so
+        unexplored space takes no memory. Although a ChunkedGrid can hold cells outside of its
+        shape, the map is still limited to the world: the pyramids, dirty tiles, likelihood field
+        and shared grid are all sized to it, and SLAM.cell_index drops cells outside of it.
+        """
+        return ChunkedGrid((self.robot.world.height() // self.grid_size,
+                            self.robot.world.width() // self.grid_size))
+
+    def level_shape(self, _level):
+        """Return the (rows, columns) of a level of detail of the grid."""
+        return (-(-self.grid.shape[0] // 2 ** _level), -(-self.grid.shape[1] // 2 ** _level))
+
+    def new_pyramid(self):
+        """Return the mean and maximum pooled levels of detail of an unknown grid.
+
+        Both are lists with a ChunkedGrid of probabilities for each level, and None in place of
+        level 0, which is the grid itself.
+        """
+        return ([None] + [ChunkedGrid(self.level_shape(_level), 0.5)
+                          for _level in range(1, self.levels)],
+                [None] + [ChunkedGrid(self.level_shape(_level), 0.5)
+                          for _level in range(1, self.levels)])
+
+    def new_dirty_tiles(self):
+        """Return a map of the tiles of each level of detail of the grid, with every tile marked
+        as needing to be redrawn."""
+        return [np.ones((-(-self.level_shape(_level)[0] // self.tile_size),
+                         -(-self.level_shape(_level)[1] // self.tile_size)), dtype=bool)
+                for _level in range(self.levels)]
+
+    def probability(self):
+        """Return the occupancy grid as an array of probabilities."""
+        with self.lock:
+            return utils.probability(np.asarray(self.grid))
+
+    def save_ros_map(self, _yaml_path):
+        """Save the occupancy grid as a ROS map_server map, at the world's real world scale.
+
+        Cells above the occupied probability are written as occupied, and cells that have been
+        seen more often empty than not are written as free.
+        """
+        map_io.save_ros_map(_yaml_path,
+                            self.probability(),
+                            self.grid_size * self.robot.world.metres_per_pixel,
+                            self.p_occupied,
+                            0.5)
 
     def update(self):
-        """Update SLAM visuals."""
+        """Update SLAM visuals.
+
+        Returns a list of the rects drawn to the screen that may have changed since last frame.
+        """
         if self.show_occupancy_grid:
-            self.draw_grid()
+            return self.draw_grid()
+        return []
 
     def odometry(self, _vel_vector):
-        """Adds a random error to the positional data within a percentage tolerance."""
+        """Adds a random error to the positional data within a percentage tolerance.
+
+        With the particle filter or scan matcher, their estimates are also moved by the noisy
+        movement.
+        """
         try:
-            self.odo_x += np.random.normal(_vel_vector[0], np.abs(_vel_vector[0]) * self.odo_error)
-            self.odo_y += np.random.normal(_vel_vector[1], np.abs(_vel_vector[1]) * self.odo_error)
+            _dx = self.rng.normal(_vel_vector[0], np.abs(_vel_vector[0]) * self.odo_error)
+            _dy = self.rng.normal(_vel_vector[1], np.abs(_vel_vector[1]) * self.odo_error)
+            self.odo_x += _dx
+            self.odo_y += _dy
             if len(self.odo_pos) > 1000:
                 self.odo_pos.pop(0)
             self.odo_pos.append([self.odo_x, self.odo_y])
         except ValueError:
-            pass
+            return
+        if self.slam_type == "Particle Filter":
+            self.particle_filter.predict((_dx, _dy), self.odo_error)
+        elif self.slam_type == "Scan Matcher":
+            self.match_x += _dx
+            self.match_y += _dy
+        if self.slam_type in ("Particle Filter", "Scan Matcher"):
+            if len(self.estimate_pos) > 1000:
+                self.estimate_pos.pop(0)
+            self.estimate_pos.append(list(self.pose()))
 
     def occupancy_grid(self):
         """Occupance grid algorithm.
 
-        Loops through all points in the point cloud and lowers the probability of a space in the
-        grid being occupied if it is found on a line between the robot and a point, and increases
-        the probability if it is found at the end-point of the laser.
-        """
-
-        _rate_of_change = 0.05  # The rate at which the probability of a point is changed
-        _pc = self.robot.robot.point_cloud
-        for _point in _pc:
-            try:  # Catch instances where the end-point may be out of the game screen
-                _coords = [int(_point[0] * np.cos(_point[1]) + self.odo_x),  # Convert to cartesian
-                           int(_point[0] * np.sin(_point[1]) + self.odo_y)]
-                # Loop through the points in between the robot and the end-point of a laser
-                for _clear in utils.line_between(self.robot.robot.x_pos // self.grid_size,
-                                                 self.robot.robot.y_pos // self.grid_size,
-                                                 _coords[0] // self.grid_size,
-                                                 _coords[1] // self.grid_size)[:-1]:
-                    # Decrease occupancy probability
-                    self.grid[int(_clear[1])][int(
-                        _clear[0])] -= _rate_of_change
-                    if self.grid[int(_clear[1])][int(_clear[0])] < 0:
-                        self.grid[int(_clear[1])][int(_clear[0])] = 0
-                _grid_y = int(_coords[1] // self.grid_size)
-                _grid_x = int(_coords[0] // self.grid_size)
-                # Increase occupancy probability of the end-point
-                self.grid[_grid_y][_grid_x] += _rate_of_change
-                if self.grid[_grid_y][_grid_x] > 1:
-                    self.grid[_grid_y][_grid_x] = 1
-            except IndexError:
-                pass
+        Finds the cells on the line between the robot and the end-point of each laser in the point
+        cloud, which lower the probability of those cells being occupied, and the end-points
+        themselves, which increase it. Lasers that return the maximum length didn't hit anything,
+        so only clear the cells along their path. The whole scan is then applied to the grid at
+        once, from the position given by SLAM.pose. With the particle filter, the particles are
+        weighted by how well the scan fits the map before the position is estimated. With the scan
+        matcher, the position and heading are corrected to where the scan best fits the map.
+        """
+        _pc = np.asarray(self.robot.robot.point_cloud, dtype=np.float64).reshape(-1, 2)
+        _ranges = _pc[:, 0]
+        _angles = _pc[:, 1]
+        _hit = _ranges < self.robot.robot.initial_laser_length
+        if self.slam_type == "Particle Filter":
+            self.particle_filter.update(self.likelihood_field.score(self.particle_filter.particles,
+                                                                    _ranges,
+                                                                    _angles,
+                                                                    self.robot.robot.initial_laser_length))
+        elif self.slam_type == "Scan Matcher":
+            self.match_x, self.match_y, self.match_heading = self.scan_matcher.match(
+                self.likelihood_field,
+                (self.match_x, self.match_y, self.match_heading),
+                _ranges,
+                _angles,
+                self.robot.robot.initial_laser_length)
+            _angles = _angles + self.match_heading
+        _x, _y = self.pose()
+        # Convert to cartesian grid coordinates
+        _end_x = ((_ranges * np.cos(_angles) + _x) // self.grid_size).astype(np.int64)
+        _end_y = ((_ranges * np.sin(_angles) + _y) // self.grid_size).astype(np.int64)
+        _start_x = np.full(len(_end_x), int(_x // self.grid_size))
+        _start_y = np.full(len(_end_y), int(_y // self.grid_size))
+
+        # Every point on each laser's line except its end-point is free space
+        _xs, _ys, _ends = utils.lines_between(_start_x, _start_y, _end_x, _end_y)
+        _free = np.ones(len(_xs), dtype=bool)
+        _free[_ends] = False
+        self.update_cells(_ys[_free], _xs[_free], _end_y[_hit], _end_x[_hit])
+
+    def update_cells(self, _free_rows, _free_cols, _occupied_rows, _occupied_cols):
+        """Apply the inverse sensor model to the occupancy grid for a whole scan.
+
+        Every free cell has the log-odds of a miss added to it and every occupied cell the log-odds
+        of a hit, once per time it appears, using a scatter-add per chunk for each. Cells outside of
+        the grid are ignored. Only the cells that were changed are clamped, and the likelihood
+        field is only recomputed around cells that became, or stopped being, obstacles.
+
+        Attributes:
+            _free_rows: An array of the rows of cells that lasers passed through.
+            _free_cols: An array of the columns of cells that lasers passed through.
+            _occupied_rows: An array of the rows of cells that lasers ended in.
+            _occupied_cols: An array of the columns of cells that lasers ended in.
+        """
+        _free = self.cell_index(_free_rows, _free_cols)
+        _occupied = self.cell_index(_occupied_rows, _occupied_cols)
+        _touched = np.unique(np.concatenate((_free, _occupied)))
+        _free_rows, _free_cols = np.divmod(_free, self.grid.shape[1])
+        _occupied_rows, _occupied_cols = np.divmod(_occupied, self.grid.shape[1])
+        _touched_rows, _touched_cols = np.divmod(_touched, self.grid.shape[1])
+        _threshold = utils.log_odds(self.p_occupied)
+        _was_obstacle = self.grid[_touched_rows, _touched_cols] > _threshold
+        # The likelihood field is only used by SLAM itself, so is updated outside of the lock
+        with self.lock:
+            self.grid.add_at(_free_rows, _free_cols, utils.log_odds(self.p_miss))
+            self.grid.add_at(_occupied_rows, _occupied_cols, utils.log_odds(self.p_hit))
+            _log_odds = np.clip(self.grid[_touched_rows, _touched_cols],
+                                utils.log_odds(self.p_min),
+                                utils.log_odds(self.p_max))
+            self.grid[_touched_rows, _touched_cols] = _log_odds
+            if self.shared_grid is not None:
+                with self.shared_grid.writing() as _cells:
+                    _cells[_touched_rows, _touched_cols] = _log_odds
+            self.dirty_tiles[0][_touched_rows // self.tile_size,
+                                _touched_cols // self.tile_size] = True
+            self.update_pyramid(_touched_rows, _touched_cols)
+
+        _changed = _was_obstacle != (_log_odds > _threshold)
+        if _changed.any():
+            self.likelihood_field.update(self.grid, _threshold,
+                                         _touched_rows[_changed], _touched_cols[_changed])
+
+    def update_pyramid(self, _rows, _cols):
+        """Update the coarser levels of detail of the grid from the cells that have changed.
+
+        Only the blocks containing changed cells are pooled again on each level, from the four
+        cells of the level below that make up each of them, with one gather per level.
+
+        Attributes:
+            _rows: An array of the rows of the cells that changed.
+            _cols: An array of the columns of the cells that changed.
+        """
+        for _level in range(1, self.levels):
+            _level_cols = self.level_shape(_level)[1]
+            _blocks = np.unique((_rows // 2) * _level_cols + _cols // 2)
+            _rows, _cols = np.divmod(_blocks, _level_cols)
+            _child_rows = 2 * _rows[:, np.newaxis] + np.array([0, 0, 1, 1])
+            _child_cols = 2 * _cols[:, np.newaxis] + np.array([0, 1, 0, 1])
+            if _level == 1:
+                _mean = _maximum = utils.probability(self.grid[_child_rows, _child_cols])
+            else:
+                _mean = self.pyramid_mean[_level - 1][_child_rows, _child_cols]
+                _maximum = self.pyramid_max[_level - 1][_child_rows, _child_cols]
+            self.pyramid_mean[_level][_rows, _cols] = _mean.mean(axis=1)
+            self.pyramid_max[_level][_rows, _cols] = _maximum.max(axis=1)
+            self.dirty_tiles[_level][_rows // self.tile_size, _cols // self.tile_size] = True
+
+    def level_probability(self, _level, _top, _left, _bottom, _right, _maximum=False):
+        """Return a window of a level of detail of the grid as an array of probabilities.
+
+        Attributes:
+            _level: The level of detail, where each cell pools 2^level by 2^level grid cells.
+            _top: The first row of the window, in cells of the level.
+            _left: The first column of the window, in cells of the level.
+            _bottom: The row after the last row of the window.
+            _right: The column after the last column of the window.
+            _maximum: Whether to return the maximum of the pooled cells' probabilities, such as
+                for finding if any of them are likely to be obstacles, instead of their mean.
+        """
+        if _level == 0:
+            return utils.probability(self.grid[_top:_bottom, _left:_right])
+        _pyramid = self.pyramid_max if _maximum else self.pyramid_mean
+        return _pyramid[_level][_top:_bottom, _left:_right]
+
+    def cell_index(self, _rows, _cols):
+        """Return the flat grid indices of the given cells that lie inside the grid.
+
+        Cells outside of the grid's shape, which is the world's, are dropped rather than growing
+        the map, as nothing outside of the world can be seen.
+        """
+        _rows = np.asarray(_rows, dtype=np.int64)
+        _cols = np.asarray(_cols, dtype=np.int64)
+        _inside = ((_rows >= 0) & (_rows < self.grid.shape[0])
+                   & (_cols >= 0) & (_cols < self.grid.shape[1]))
+        return _rows[_inside] * self.grid.shape[1] + _cols[_inside]
 
     def toggle_occupancy_grid(self):
         """Toggle whether or not the occupancy grid is visualised."""
@@ -875,18 +1513,63 @@ class SLAM():
             self.show_occupancy_grid = True
 
     def draw_grid(self):
-        """Draw the occupancy grid as a function of its probability as its alpha."""
-        for i in range(len(self.grid)):
-            for j in range(len(self.grid[0])):
-                _alpha = 1 - self.grid[i][j]
-                _rect = pygame.Rect(j * self.grid_size,
-                                    i * self.grid_size,
-                                    self.grid_size,
-                                    self.grid_size)
-                pygame.draw.rect(self.screen,
-                                 (255 * _alpha, 255 * _alpha, 255 * _alpha),
-                                 _rect)
+        """Draw the occupancy grid with darker cells for higher probabilities of being occupied.
+
+        Only the tiles of the grid in the camera's view are drawn, at the level of detail that
+        matches the screen's pixels, so the cost of drawing depends on the size of the screen
+        rather than how much of the grid is in view. Each tile is kept drawn on a cached surface,
+        which is only redrawn when cells in it have changed since the last draw, or when it has
+        just come into view. The probabilities of each of those tiles are converted to a greyscale
+        image in one operation, then scaled to the tile's size on the screen.
+
+        Returns a list of the screen rects of the redrawn tiles.
+        """
+        with self.lock:
+            _camera = self.robot.world.camera
+            if _camera.zoom != self.tiles_zoom:
+                self.tile_surfaces = {}
+                self.tiles_zoom = _camera.zoom
+            _level = _camera.level(self.grid_size, self.levels, 4)
+            _dirty_tiles = self.dirty_tiles[_level]
+            _level_cells = 2 ** _level
+            _tile_pixels = self.tile_size * _level_cells * self.grid_size
+            _dirty_rects = []
+            _surfaces = {}
+            for _tile_row, _tile_col in _camera.visible_tiles(_tile_pixels, *_dirty_tiles.shape):
+                _row = _tile_row * self.tile_size
+                _col = _tile_col * self.tile_size
+                _probability = self.level_probability(_level,
+                                                      _row,
+                                                      _col,
+                                                      _row + self.tile_size,
+                                                      _col + self.tile_size)
+                _cell_pixels = _level_cells * self.grid_size
+                _rect = _camera.screen_rect(_col * _cell_pixels,
+                                            _row * _cell_pixels,
+                                            (_col + _probability.shape[1]) * _cell_pixels,
+                                            (_row + _probability.shape[0]) * _cell_pixels)
+                _surface = self.tile_surfaces.get((_tile_row, _tile_col))
+                if (_surface is None or _dirty_tiles[_tile_row, _tile_col]
+                        or _surface.get_size() != _rect.size):
+                    _grey = ((1 - _probability.T) * 255).astype(np.uint8)
+                    _grey = np.repeat(_grey[:, :, np.newaxis], 3, axis=2)
+                    _image = pygame.surfarray.make_surface(_grey)
+                    _surface = pygame.transform.scale(_image, _rect.size)
+                    _dirty_tiles[_tile_row, _tile_col] = False
+                    _dirty_rects.append(_rect)
+                _surface.set_alpha(self.grid_alpha if self.grid_alpha < 255 else None)
+                self.screen.blit(_surface, _rect)
+                _surfaces[_tile_row, _tile_col] = _surface
+            # Tiles that have left the screen are drawn again if they come back into view
+            self.tile_surfaces = _surfaces
+            return _dirty_rects
 
 
 if __name__ == '__main__':
-    Game()
+    _parser = argparse.ArgumentParser(description="Run the SLAM visualiser.")
+    _parser.add_argument("--map", default=None,
+                         help="Grid file, or ROS map YAML file, to load the world map from.")
+    _parser.add_argument("--record", default=None,
+                         help="Log file to record every scan and pose of the session to.")
+    _args = _parser.parse_args()
+    Game(_args.record, _args.map)
@@ -29,6 +29,170 @@ def line_between(_x, _y, _a, _b):
             _points_in_line.append((_nx, _ny))
             return _points_in_line
 
+def lines_between(_x, _y, _a, _b):
+    """Bresenham's line algorithm for many lines at once.
+
+    Produces the same points as line_between for each line from (_x[i], _y[i]) to (_a[i], _b[i]),
+    but computes every point of every line in a single set of array operations.
+
+    Attributes:
+        _x: An array of the x coordinates of each line's start.
+        _y: An array of the y coordinates of each line's start.
+        _a: An array of the x coordinates of each line's end.
+        _b: An array of the y coordinates of each line's end.
+
+    Returns:
+        A tuple of (xs, ys, ends). xs and ys are flat arrays of the points of all lines, one line
+        after another, and ends is an array of the index in xs and ys of each line's end-point.
+    """
+    _x = np.asarray(_x, dtype=np.int64).reshape(-1)
+    _y = np.asarray(_y, dtype=np.int64).reshape(-1)
+    _a = np.asarray(_a, dtype=np.int64).reshape(-1)
+    _b = np.asarray(_b, dtype=np.int64).reshape(-1)
+    _dx = np.abs(_a - _x)
+    _dy = np.abs(_b - _y)
+    _sx = np.where(_x > _a, -1, 1)
+    _sy = np.where(_y > _b, -1, 1)
+    # Step along whichever axis the line is longest in, as line_between does
+    _x_major = _dx > _dy
+    _major = np.where(_x_major, _dx, _dy)
+    _minor = np.where(_x_major, _dy, _dx)
+    _counts = _major + 1
+    _ends = np.cumsum(_counts) - 1
+    _line = np.repeat(np.arange(len(_counts)), _counts)
+    _starts = _ends - _major
+    _step = np.arange(_counts.sum()) - np.repeat(_starts, _counts)
+
+    # The number of minor axis steps taken after each major axis step, which is the smallest
+    # count that keeps Bresenham's error term from going negative
+    _major_rep = _major[_line]
+    _num = 2 * _step * _minor[_line] - _major_rep
+    _den = np.maximum(2 * _major_rep, 1)
+    _minor_step = -((-_num) // _den)
+    _along_x = _x_major[_line]
+    _xs = _x[_line] + _sx[_line] * np.where(_along_x, _step, _minor_step)
+    _ys = _y[_line] + _sy[_line] * np.where(_along_x, _minor_step, _step)
+    return _xs, _ys, _ends
+
+
 def point_distance(x_1, x_2, y_1, y_2):
     """Find the distance between two points on a 2D plane."""
-    return np.sqrt(np.square(x_1 - x_2) + np.square(y_1 - y_2))
\ No newline at end of file
+    return np.sqrt(np.square(x_1 - x_2) + np.square(y_1 - y_2))
+
+
+def log_odds(_probability):
+    """Convert a probability to log-odds."""
+    return np.log(_probability / (1 - _probability))
+
+
+def probability(_log_odds):
+    """Convert log-odds to a probability."""
+    return 1 / (1 + np.exp(-_log_odds))
+
+
+def pool(_array, _factor, _reduce, _fill):
+    """Reduce each _factor by _factor block of a 2D array to a single value.
+
+    Attributes:
+        _array: The 2D array to pool. Its edges are padded with _fill to a whole number of blocks.
+        _factor: The width of each square block.
+        _reduce: A NumPy reduction that takes an axis argument, such as np.max or np.mean.
+        _fill: The value that the array is padded with.
+    """
+    if _factor == 1:
+        return _array
+    _rows = -(-_array.shape[0] // _factor)
+    _cols = -(-_array.shape[1] // _factor)
+    _padded = np.full((_rows * _factor, _cols * _factor), _fill, dtype=_array.dtype)
+    _padded[:_array.shape[0], :_array.shape[1]] = _array
+    return _reduce(_padded.reshape(_rows, _factor, _cols, _factor), axis=(1, 3))
+
+
+def cast_rays(_grid, _cell_size, _x, _y, _angles, _max_range, _directions=None):
+    """Vectorised Amanatides-Woo traversal of a grid along many rays from the same origin.
+
+    All rays are stepped through the grid in lockstep, one cell boundary per iteration, with the
+    rays that have hit a wall or left the grid dropped from the working set as they finish. The
+    grid is only read at the cells the rays visit, so no copy of it is made.
+
+    Attributes:
+        _grid: A 2D NumPy array of cells, indexed [row, column], where non-zero cells are
+            occupied.
+        _cell_size: The width of each grid cell in pixels.
+        _x: The x position of the rays' origin in pixels.
+        _y: The y position of the rays' origin in pixels.
+        _angles: An array of ray directions in radians.
+        _max_range: The maximum length of the rays in pixels.
+        _directions: An array of the (x, y) unit vector of each ray, one row per ray, if they have
+            already been computed from the angles.
+
+    Returns:
+        A tuple of (ranges, rows, columns) arrays, one entry per ray. Rays that miss have a range
+        of _max_range and a row and column of -1.
+    """
+    _angles = np.asarray(_angles, dtype=np.float64)
+    _count = len(_angles)
+    _rows, _cols = _grid.shape
+    _ranges = np.full(_count, _max_range, dtype=np.float64)
+    _hit_rows = np.full(_count, -1, dtype=np.int64)
+    _hit_cols = np.full(_count, -1, dtype=np.int64)
+    _start_col = int(_x // _cell_size)
+    _start_row = int(_y // _cell_size)
+    if not (0 <= _start_row < _rows and 0 <= _start_col < _cols) or _count == 0:
+        return _ranges, _hit_rows, _hit_cols
+    if _grid[_start_row, _start_col]:
+        _ranges[:] = 0
+        _hit_rows[:] = _start_row
+        _hit_cols[:] = _start_col
+        return _ranges, _hit_rows, _hit_cols
+
+    if _directions is None:
+        _dx = np.cos(_angles)
+        _dy = np.sin(_angles)
+    else:
+        _dx = _directions[:, 0]
+        _dy = _directions[:, 1]
+    _step_x = np.sign(_dx).astype(np.int64)
+    _step_y = np.sign(_dy).astype(np.int64)
+    # Distance along each ray to its next vertical and horizontal cell boundaries, and the distance
+    # between consecutive boundaries. Rays parallel to an axis never cross that axis' boundaries.
+    _next_x = (_start_col + (_step_x > 0)) * _cell_size
+    _next_y = (_start_row + (_step_y > 0)) * _cell_size
+    with np.errstate(divide='ignore', invalid='ignore'):
+        _t_max_x = np.where(_step_x != 0, (_next_x - _x) / _dx, np.inf)
+        _t_max_y = np.where(_step_y != 0, (_next_y - _y) / _dy, np.inf)
+        _t_delta_x = np.where(_step_x != 0, _cell_size / np.abs(_dx), np.inf)
+        _t_delta_y = np.where(_step_y != 0, _cell_size / np.abs(_dy), np.inf)
+
+    _index = np.arange(_count)
+    _col = np.full(_count, _start_col, dtype=np.int64)
+    _row = np.full(_count, _start_row, dtype=np.int64)
+    while len(_index):
+        _along_x = _t_max_x < _t_max_y
+        _along_y = ~_along_x
+        _t = np.where(_along_x, _t_max_x, _t_max_y)
+        _col[_along_x] += _step_x[_along_x]
+        _row[_along_y] += _step_y[_along_y]
+        _t_max_x[_along_x] += _t_delta_x[_along_x]
+        _t_max_y[_along_y] += _t_delta_y[_along_y]
+
+        _inside = (_t <= _max_range) & (_row >= 0) & (_row < _rows) & (_col >= 0) & (_col < _cols)
+        _hit = np.zeros(len(_index), dtype=bool)
+        _hit[_inside] = _grid[_row[_inside], _col[_inside]] != 0
+        _hit_index = _index[_hit]
+        _ranges[_hit_index] = _t[_hit]
+        _hit_rows[_hit_index] = _row[_hit]
+        _hit_cols[_hit_index] = _col[_hit]
+
+        # Only keep stepping the rays that are still inside the grid and haven't hit anything
+        _keep = _inside & ~_hit
+        _index = _index[_keep]
+        _col = _col[_keep]
+        _row = _row[_keep]
+        _t_max_x = _t_max_x[_keep]
+        _t_max_y = _t_max_y[_keep]
+        _t_delta_x = _t_delta_x[_keep]
+        _t_delta_y = _t_delta_y[_keep]
+        _step_x = _step_x[_keep]
+        _step_y = _step_y[_keep]
+    return _ranges, _hit_rows, _hit_cols